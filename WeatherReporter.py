@@ -1,9 +1,27 @@
-import requests
 import os
-from dotenv import load_dotenv
-from datetime import datetime, timedelta
-
-load_dotenv()
+import sys
+import abc
+import io
+import csv
+import json
+import time
+import argparse
+import contextlib
+import functools
+import math
+import re
+import bisect
+import heapq
+import itertools
+import threading
+import unicodedata
+from array import array
+from urllib.parse import urlencode, urlsplit, parse_qs
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+
+# requests and python-dotenv are imported where they are first needed: together they take far longer to
+# import than the rest of this module, and cached reports or library use of the formatters need neither.
 GEOCODING_API_URL = "http://api.openweathermap.org/geo/1.0/direct"
 WEATHER_API_URL_BASE = "https://api.open-meteo.com/v1/forecast"
 
@@ -18,11 +36,130 @@ LINE_SEPARATOR_SHORT = "─" * 40
 LINE_SEPARATOR_MEDIUM = "─" * 60
 LINE_SEPARATOR_LONG = "─" * 80
 
-API_TIMEOUT = 10
+GEOCODING_STAGE = "geocoding"
+FORECAST_STAGE = "forecast"
+# (connect, read) seconds per upstream call
+STAGE_TIMEOUTS = {
+    GEOCODING_STAGE: (3.05, 10),
+    FORECAST_STAGE: (3.05, 20),
+}
+HTTP_POOL_SIZE = 16
+HTTP_MAX_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_BACKOFF_MAX_SECONDS = 30
+# 429 is retried by the upstream schedulers instead, so every caller backs off together
+HTTP_RETRY_STATUSES = (500, 502, 503, 504)
+HTTP_RATE_LIMITED_STATUS = 429
+HTTP_USER_AGENT = "WeatherReporter (python-requests)"
+# (sustained requests per second, burst) per upstream: the OpenWeatherMap free plan allows 60 geocoding calls a
+# minute and Open-Meteo's free tier 600 forecast calls a minute
+UPSTREAM_RATE_LIMITS = {
+    GEOCODING_STAGE: (1.0, 10),
+    FORECAST_STAGE: (10.0, 20),
+}
+# Pause after a 429 that carries no Retry-After
+RATE_LIMIT_DEFAULT_PAUSE_SECONDS = 5
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+CACHE_DIR_ENV_VAR = 'WEATHER_REPORTER_CACHE_DIR'
+# Set to "json" to decode responses with the standard library even when orjson is installed
+JSON_BACKEND_ENV_VAR = 'WEATHER_REPORTER_JSON_BACKEND'
+# Bytes read at a time from a streamed multi-location forecast response
+STREAM_CHUNK_BYTES = 64 * 1024
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "weather_reporter")
+GEOCODE_CACHE_FILENAME = "geocode_cache.json"
+GEOCODE_CACHE_MAX_ENTRIES = 5000
+GEOCODE_CACHE_TTL_SECONDS = 90 * 24 * 3600
+
+CITY_INDEX_FILENAME = "city_index.bin"
+CITY_INDEX_MAGIC = b"WRCITIES1\n"
+CITY_INDEX_MIN_PREFIX_LENGTH = 3
+CITY_INDEX_FUZZY_MAX_DISTANCE = 2
+
+FORECAST_MODEL = "best_match"
+# Approximate horizontal grid spacing of Open-Meteo models in degrees; best_match blends several models
+MODEL_GRID_RESOLUTIONS = {
+    "best_match": 0.1,
+    "ecmwf_ifs025": 0.25,
+    "icon_global": 0.125,
+    "icon_eu": 0.0625,
+    "icon_d2": 0.02,
+    "gem_global": 0.15,
+    "jma_gsm": 0.5,
+    "icon_seamless": 0.02,
+    "gfs_global": 0.25,
+    "gfs_seamless": 0.03,
+}
+# Models fetched by --ensemble; the forecast shows their mean with the min-max range and spread across them
+ENSEMBLE_MODELS = ("icon_seamless", "gfs_seamless", "ecmwf_ifs025")
+# Variables taken from the first model instead of averaged: categorical codes and flags, and circular directions
+ENSEMBLE_COPIED_VARIABLES = ("weather_code", "is_day", "wind_direction_10m", "wind_direction_10m_dominant")
+ENSEMBLE_STATISTICS = ("min", "max", "spread")
+MODEL_GRID_RESOLUTION_DEG = MODEL_GRID_RESOLUTIONS[FORECAST_MODEL]
+FORECAST_CACHE_DIRNAME = "forecasts"
+FORECAST_CACHE_MAX_ENTRIES = 1000
+FORECAST_MIN_TTL_SECONDS = 60
+FORECAST_DEFAULT_TTL_SECONDS = 3600
+FORECAST_STALE_GRACE_SECONDS = 3600
+FORECAST_ARCHIVE_FILENAME = "forecast_archive.sqlite3"
+WEATHER_BATCH_MAX_LOCATIONS = 100
+WEATHER_BATCH_MAX_URL_LENGTH = 8000
+
+CURRENT_SECTION_FIELDS = (
+    "weather_code", "temperature_2m", "relative_humidity_2m", "precipitation", "rain", "showers", "snowfall",
+    "wind_speed_10m", "wind_direction_10m", "wind_gusts_10m", "cloud_cover", "pressure_msl", "surface_pressure", "is_day",
+)
+DAILY_SECTION_FIELDS = (
+    "weather_code", "temperature_2m_max", "temperature_2m_min", "precipitation_sum", "rain_sum", "showers_sum",
+    "snowfall_sum", "precipitation_probability_max", "precipitation_hours", "sunrise", "sunset", "daylight_duration",
+    "sunshine_duration", "uv_index_max", "wind_speed_10m_max", "wind_gusts_10m_max", "wind_direction_10m_dominant",
+    "dew_point_2m_mean", "visibility_mean",
+)
+HOURLY_SECTION_FIELDS = (
+    "weather_code", "temperature_2m", "relative_humidity_2m", "dew_point_2m", "precipitation_probability",
+    "precipitation", "rain", "showers", "snowfall", "snow_depth", "visibility", "cloud_cover", "wind_speed_10m",
+    "wind_direction_10m", "wind_gusts_10m", "uv_index", "pressure_msl", "freezing_level_height",
+    "wet_bulb_temperature_2m", "evapotranspiration", "is_day",
+)
+SECTION_FIELDS = {
+    "current": CURRENT_SECTION_FIELDS,
+    "daily": DAILY_SECTION_FIELDS,
+    "hourly": HOURLY_SECTION_FIELDS,
+}
+DISPLAY_SECTIONS = tuple(SECTION_FIELDS)
+
+# Daily aggregates of hourly variables, computed locally instead of requested whenever the hourly section is fetched
+LOCAL_DAILY_FIELDS = (
+    "temperature_2m_max", "temperature_2m_min", "precipitation_sum", "rain_sum", "showers_sum", "snowfall_sum",
+    "precipitation_probability_max", "uv_index_max", "wind_speed_10m_max", "wind_gusts_10m_max",
+    "dew_point_2m_mean", "visibility_mean",
+)
+DAILY_REDUCTIONS = ("min", "max", "mean", "sum")
+AGGREGATE_PRECISION = 1
+# Hourly variables --daily-aggregates may reduce besides the displayed ones (and the derived heat_index / wind_chill)
+AGGREGATE_EXTRA_HOURLY_VARIABLES = (
+    "apparent_temperature", "surface_pressure", "cloud_cover_low", "cloud_cover_mid", "cloud_cover_high",
+    "vapour_pressure_deficit", "shortwave_radiation", "sunshine_duration", "et0_fao_evapotranspiration", "cape",
+    "soil_temperature_0cm", "soil_moisture_0_to_1cm",
+)
+
+HISTORY_DAILY_VARIABLES = ("temperature_2m_max", "temperature_2m_min", "precipitation_sum",
+                           "precipitation_probability_max", "wind_speed_10m_max")
+HISTORY_HOURLY_VARIABLES = ("temperature_2m", "precipitation_probability", "precipitation", "wind_speed_10m", "cloud_cover")
+OBSERVED_VARIABLES = ("temperature_2m", "relative_humidity_2m", "precipitation", "wind_speed_10m", "cloud_cover")
+
+WATCH_MIN_INTERVAL_SECONDS = 60
+WATCH_MAX_SLEEP_SECONDS = 900
+WATCH_OUTPUT_FORMATS = ("text", "ndjson")
+
+BATCH_GEOCODE_CONCURRENCY = 8
+BATCH_WEATHER_CONCURRENCY = 8
 
 FULL_DATETIME_FORMAT = "%A, %d %B %Y %H:%M"
 TIME_ONLY_FORMAT = "%H:%M"
 DAILY_DATE_FORMAT = "%a, %d %b"
+ARCHIVE_TIME_FORMAT = "%a %d %b %H:%M"
 
 WMO_WEATHER_CODES = {
     0: "Clear sky",
@@ -55,7 +192,24 @@ WMO_WEATHER_CODES = {
     99: "Thunderstorm with heavy hail",
 }
 
+_WMO_DESCRIPTIONS_BY_CODE = tuple(WMO_WEATHER_CODES.get(code) for code in range(max(WMO_WEATHER_CODES) + 1))
+_CARDINAL_BY_DEGREE = tuple(CARDINAL_DIRECTIONS[round(degree / DEGREES_PER_CARDINAL_STEP) % len(CARDINAL_DIRECTIONS)]
+                            for degree in range(360))
+_FIXED_POINT_SPECS = tuple(f".{precision}f" for precision in range(7))
+_NUMERIC_TYPES = (int, float)
+
+def _matches_default(value, default_val):
+    """ Same result as `value is None or str(value) == default_val`, without the str() for plain numbers """
+    if value is None:
+        return True
+    if default_val == DEFAULT_NA and type(value) in _NUMERIC_TYPES:
+        return False
+    return str(value) == default_val
+
 def get_weather_description(code, default_val=DEFAULT_NA):
+    if type(code) is int and 0 <= code < len(_WMO_DESCRIPTIONS_BY_CODE):
+        description = _WMO_DESCRIPTIONS_BY_CODE[code]
+        return description if description is not None else f"Code {code}"
     if code is None:
         return default_val
     try:
@@ -65,7 +219,12 @@ def get_weather_description(code, default_val=DEFAULT_NA):
 
 
 def format_value_with_unit(value, unit, default_val=DEFAULT_NA, precision=None):
-    if value is None or str(value) == default_val:
+    if default_val == DEFAULT_NA and type(value) in _NUMERIC_TYPES:
+        if precision is None:
+            return f"{value}{unit}"
+        if type(precision) is int and 0 <= precision < len(_FIXED_POINT_SPECS):
+            return format(value, _FIXED_POINT_SPECS[precision]) + unit
+    if _matches_default(value, default_val):
         return default_val
     
     if isinstance(default_val, str) and default_val.startswith("0.0") and \
@@ -78,6 +237,8 @@ def format_value_with_unit(value, unit, default_val=DEFAULT_NA, precision=None):
                 value_num = float(value)
             else:
                 value_num = value
+            if type(precision) is int and 0 <= precision < len(_FIXED_POINT_SPECS):
+                return format(value_num, _FIXED_POINT_SPECS[precision]) + unit
             return f"{value_num:.{precision}f}{unit}"
         except (ValueError, TypeError):
             return f"{value}{unit}"
@@ -88,9 +249,7 @@ def _handle_iso_string_for_datetime(iso_str):
         return iso_str[:-1] + '+00:00'
     return iso_str
 
-def format_timestamp(iso_timestamp, fmt=FULL_DATETIME_FORMAT, default_val=DEFAULT_NA):
-    if not iso_timestamp or iso_timestamp == default_val:
-        return default_val
+def _format_timestamp_uncached(iso_timestamp, fmt):
     try:
         processed_iso_str = _handle_iso_string_for_datetime(iso_timestamp)
         dt_obj = datetime.fromisoformat(processed_iso_str)
@@ -98,20 +257,39 @@ def format_timestamp(iso_timestamp, fmt=FULL_DATETIME_FORMAT, default_val=DEFAUL
     except (ValueError, TypeError):
         return str(iso_timestamp)
 
+# Batches share the same hourly timestamps and dates across locations, so labels repeat constantly
+_format_timestamp_cached = functools.lru_cache(maxsize=8192)(_format_timestamp_uncached)
+
+def format_timestamp(iso_timestamp, fmt=FULL_DATETIME_FORMAT, default_val=DEFAULT_NA):
+    if not iso_timestamp or iso_timestamp == default_val:
+        return default_val
+    if type(iso_timestamp) is str and type(fmt) is str:
+        return _format_timestamp_cached(iso_timestamp, fmt)
+    return _format_timestamp_uncached(iso_timestamp, fmt)
+
 def format_time_from_iso(iso_datetime_str, fmt=TIME_ONLY_FORMAT, default_val=DEFAULT_NA):
     return format_timestamp(iso_datetime_str, fmt, default_val)
 
-def format_daily_date(iso_date_str, fmt=DAILY_DATE_FORMAT, default_val=DEFAULT_NA):
-    if not iso_date_str or iso_date_str == default_val:
-        return default_val
+def _format_daily_date_uncached(iso_date_str, fmt):
     try:
         dt_obj = datetime.strptime(iso_date_str, "%Y-%m-%d")
         return dt_obj.strftime(fmt)
     except (ValueError, TypeError):
         return str(iso_date_str)
 
+_format_daily_date_cached = functools.lru_cache(maxsize=1024)(_format_daily_date_uncached)
+
+def format_daily_date(iso_date_str, fmt=DAILY_DATE_FORMAT, default_val=DEFAULT_NA):
+    if not iso_date_str or iso_date_str == default_val:
+        return default_val
+    if type(iso_date_str) is str and type(fmt) is str:
+        return _format_daily_date_cached(iso_date_str, fmt)
+    return _format_daily_date_uncached(iso_date_str, fmt)
+
 def degrees_to_cardinal(d, default_val=DEFAULT_NA):
-    if d is None or str(d) == default_val:
+    if type(d) is int and default_val == DEFAULT_NA:
+        return _CARDINAL_BY_DEGREE[d % 360]
+    if _matches_default(d, default_val):
         return default_val
     try:
         d_float = float(d)
@@ -122,7 +300,7 @@ def degrees_to_cardinal(d, default_val=DEFAULT_NA):
         return str(d)
 
 def format_duration(total_seconds, default_val=DEFAULT_NA):
-    if total_seconds is None or str(total_seconds) == default_val:
+    if _matches_default(total_seconds, default_val):
         return default_val
     try:
         val = float(total_seconds)
@@ -139,7 +317,7 @@ def format_duration(total_seconds, default_val=DEFAULT_NA):
         return str(total_seconds)
 
 def format_visibility_km(visibility_m, unit_str='m', default_val=DEFAULT_NA):
-    if visibility_m is None or str(visibility_m) == default_val:
+    if _matches_default(visibility_m, default_val):
         return default_val
     try:
         val_float = float(visibility_m)
@@ -155,12 +333,614 @@ def format_visibility_km(visibility_m, unit_str='m', default_val=DEFAULT_NA):
         return f"{visibility_m} {unit_str}"
 
 
-def get_coordinates(city_name, api_key):
+def weather_description_column(codes, default_val=DEFAULT_NA):
+    table, table_size = _WMO_DESCRIPTIONS_BY_CODE, len(_WMO_DESCRIPTIONS_BY_CODE)
+    return [table[code] if type(code) is int and 0 <= code < table_size and table[code] is not None
+            else get_weather_description(code, default_val) for code in codes]
+
+def degrees_to_cardinal_column(degrees, default_val=DEFAULT_NA):
+    table = _CARDINAL_BY_DEGREE
+    return [table[d % 360] if type(d) is int and default_val == DEFAULT_NA
+            else degrees_to_cardinal(d, default_val) for d in degrees]
+
+def format_value_column(values, unit, default_val=DEFAULT_NA, precision=None):
+    if precision is None or not (type(precision) is int and 0 <= precision < len(_FIXED_POINT_SPECS)) or \
+       (isinstance(default_val, str) and default_val.startswith("0.0")):
+        return [format_value_with_unit(value, unit, default_val, precision) for value in values]
+    spec = _FIXED_POINT_SPECS[precision]
+    return [format(value, spec) + unit if type(value) in _NUMERIC_TYPES and default_val == DEFAULT_NA
+            else format_value_with_unit(value, unit, default_val, precision) for value in values]
+
+def format_timestamp_column(iso_timestamps, fmt=FULL_DATETIME_FORMAT, default_val=DEFAULT_NA):
+    return [format_timestamp(iso_timestamp, fmt, default_val) for iso_timestamp in iso_timestamps]
+
+def format_daily_date_column(iso_dates, fmt=DAILY_DATE_FORMAT, default_val=DEFAULT_NA):
+    return [format_daily_date(iso_date, fmt, default_val) for iso_date in iso_dates]
+
+def format_visibility_column(visibilities_m, unit_str='m', default_val=DEFAULT_NA):
+    return [format_visibility_km(visibility_m, unit_str, default_val) for visibility_m in visibilities_m]
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+_http_settings = {
+    "pool_size": HTTP_POOL_SIZE,
+    "max_retries": HTTP_MAX_RETRIES,
+    "backoff_factor": HTTP_BACKOFF_FACTOR,
+}
+
+def _build_http_session(pool_size, max_retries, backoff_factor):
+    import inspect
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class UpstreamRetry(Retry):
+        # urllib3 would retry a 429 carrying Retry-After on its own; those are left to the upstream schedulers
+        RETRY_AFTER_STATUS_CODES = Retry.RETRY_AFTER_STATUS_CODES - {HTTP_RATE_LIMITED_STATUS}
+        # urllib3 1.x caps the backoff with these class attributes; 2.x takes backoff_max instead
+        DEFAULT_BACKOFF_MAX = BACKOFF_MAX = HTTP_BACKOFF_MAX_SECONDS
+
+    retry_options = {}
+    if "backoff_max" in inspect.signature(Retry.__init__).parameters:
+        retry_options["backoff_max"] = HTTP_BACKOFF_MAX_SECONDS
+    retry = UpstreamRetry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=True,
+        # Hand the last error response back so raise_for_status() reports it like any other HTTP error
+        raise_on_status=False,
+        **retry_options,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate", "User-Agent": HTTP_USER_AGENT})
+    return session
+
+def get_http_session():
+    """ The shared keep-alive session used for every upstream call, created on first use """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                _http_session = _build_http_session(**_http_settings)
+    return _http_session
+
+def configure_http(pool_size=None, max_retries=None, backoff_factor=None, timeouts=None):
+    """ Changes pool/retry settings and per-stage (connect, read) timeouts; the session is rebuilt on next use """
+    global _http_session
+    with _http_session_lock:
+        for name, value in (("pool_size", pool_size), ("max_retries", max_retries), ("backoff_factor", backoff_factor)):
+            if value is not None:
+                _http_settings[name] = value
+        for stage, timeout in (timeouts or {}).items():
+            if stage not in STAGE_TIMEOUTS:
+                raise ValueError(f"unknown stage {stage!r}, expected one of {', '.join(STAGE_TIMEOUTS)}")
+            STAGE_TIMEOUTS[stage] = timeout if isinstance(timeout, tuple) else (min(STAGE_TIMEOUTS[stage][0], timeout), timeout)
+        if _http_session is not None:
+            _http_session.close()
+            _http_session = None
+
+class UpstreamScheduler:
+    """ Admits the calls to one upstream in priority order (then first come, first served), within a token bucket
+    and an adaptive concurrency limit: every 429 halves the limit and pauses admissions for the Retry-After
+    delay, and each full window of successful calls grows the limit back by one """
+
+    def __init__(self, rate=None, burst=1, max_concurrency=HTTP_POOL_SIZE):
+        self.requests = self.rate_limited = 0
+        self.waited_seconds = 0.0
+        self._active = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self.configure(rate, burst, max_concurrency)
+
+    def configure(self, rate=None, burst=1, max_concurrency=None):
+        """ rate is in calls per second; None lifts the rate limit """
+        with self._condition:
+            self.rate = rate if rate and rate > 0 else None
+            self.burst = max(1, int(burst or 1))
+            self.tokens = float(self.burst)
+            self._updated = time.monotonic()
+            if max_concurrency is not None:
+                self.max_concurrency = self.limit = max(1, max_concurrency)
+            self._condition.notify_all()
+
+    def _delay(self, now):
+        """ Seconds until the next call may start, given a free concurrency slot """
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.rate is None:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE):
+        started = time.monotonic()
+        entry = [priority, next(self._sequence)]
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            while True:
+                if self._waiting[0] is entry and self._active < self.limit:
+                    delay = self._delay(time.monotonic())
+                    if delay <= 0:
+                        break
+                    self._condition.wait(delay)
+                else:
+                    self._condition.wait()
+            heapq.heappop(self._waiting)
+            if self.rate is not None:
+                self.tokens -= 1
+            self._active += 1
+            self.requests += 1
+            self.waited_seconds += time.monotonic() - started
+            self._condition.notify_all()
+
+    def release(self, status=None, retry_after=None):
+        """ Ends a call; status is its HTTP status, or None if it failed without a response """
+        with self._condition:
+            self._active -= 1
+            if status == HTTP_RATE_LIMITED_STATUS:
+                self.rate_limited += 1
+                self._successes = 0
+                self.limit = max(1, self.limit // 2)
+                pause = RATE_LIMIT_DEFAULT_PAUSE_SECONDS if retry_after is None else retry_after
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                self.tokens = min(self.tokens, 0.0)
+            elif status is not None:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {"requests": self.requests, "rate_limited": self.rate_limited,
+                    "waited_seconds": round(self.waited_seconds, 3), "queued": len(self._waiting),
+                    "concurrency": self.limit, "max_concurrency": self.max_concurrency,
+                    "rate": self.rate, "burst": self.burst}
+
+upstream_schedulers = {stage: UpstreamScheduler(rate, burst) for stage, (rate, burst) in UPSTREAM_RATE_LIMITS.items()}
+_fetch_priority = threading.local()
+
+@contextlib.contextmanager
+def fetch_priority(priority):
+    """ Runs the upstream calls made by this thread inside the block at the given priority """
+    previous = getattr(_fetch_priority, "value", PRIORITY_INTERACTIVE)
+    _fetch_priority.value = priority
+    try:
+        yield
+    finally:
+        _fetch_priority.value = previous
+
+def configure_rate_limits(limits=None, max_concurrency=None):
+    """ Sets the (rate per second, burst) of the given upstream stages, None lifting a stage's rate limit, and the
+    concurrency ceiling of every upstream """
+    for stage, limit in (limits or {}).items():
+        if stage not in upstream_schedulers:
+            raise ValueError(f"unknown stage {stage!r}, expected one of {', '.join(upstream_schedulers)}")
+        rate, burst = limit if limit is not None else (None, 1)
+        upstream_schedulers[stage].configure(rate, burst, max_concurrency)
+    if max_concurrency is not None:
+        for stage, scheduler in upstream_schedulers.items():
+            if stage not in (limits or {}):
+                scheduler.configure(scheduler.rate, scheduler.burst, max_concurrency)
+
+def parse_rate_limit(text):
+    """ "forecast=5/10" -> ("forecast", (5.0, 10)); "geocoding=off" -> ("geocoding", None) """
+    stage, separator, limit = text.partition("=")
+    stage, limit = stage.strip(), limit.strip()
+    if not separator or stage not in upstream_schedulers:
+        raise ValueError(f"{text!r} is not STAGE=RATE[/BURST] with STAGE one of {', '.join(upstream_schedulers)}")
+    if limit in ("off", "0"):
+        return stage, None
+    rate, _, burst = limit.partition("/")
+    rate = float(rate)
+    burst = int(burst) if burst else max(1, math.ceil(rate))
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"{text!r} needs a positive rate and burst")
+    return stage, (rate, burst)
+
+def _retry_after_seconds(value):
+    """ Retry-After as seconds from now (it may be a delay or an HTTP date), capped at the backoff maximum """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        from email.utils import parsedate_to_datetime
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(0.0, seconds), HTTP_BACKOFF_MAX_SECONDS)
+
+def http_get(stage, url, params, stream=False):
+    """ One upstream GET, admitted by the stage's scheduler; 429 responses are retried once the shared pause is over.
+    With stream, the body is left unread for the caller to iterate and close. """
+    scheduler = upstream_schedulers[stage]
+    priority = getattr(_fetch_priority, "value", PRIORITY_INTERACTIVE)
+    for _ in range(_http_settings["max_retries"] + 1):
+        scheduler.acquire(priority)
+        status = retry_after = None
+        try:
+            response = get_http_session().get(url, params=params, timeout=STAGE_TIMEOUTS[stage], stream=stream)
+            status = response.status_code
+            if status == HTTP_RATE_LIMITED_STATUS:
+                retry_after = _retry_after_seconds(response.headers.get("Retry-After"))
+        finally:
+            scheduler.release(status, retry_after)
+        if status != HTTP_RATE_LIMITED_STATUS:
+            break
+        response.close()
+    return response
+
+@functools.lru_cache(maxsize=None)
+def _json_loads_function():
+    """ orjson.loads when orjson is installed, which decodes forecast payloads several times faster, else json.loads """
+    if os.environ.get(JSON_BACKEND_ENV_VAR, "").lower() != "json":
+        try:
+            import orjson
+        except ImportError:
+            pass
+        else:
+            return orjson.loads
+    return json.loads
+
+def json_backend():
+    """ Name of the module decoding responses: "orjson" or "json" """
+    return _json_loads_function().__module__.split(".")[0]
+
+def decode_json(stage, data):
+    return _json_loads_function()(data)
+
+def decode_response(stage, response):
+    return decode_json(stage, response.content)
+
+# A complete or unterminated (group 1 unset) JSON string, or a bracket outside strings
+_JSON_STRUCTURE_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*(")?|[\[\]{}]')
+_JSON_ELEMENT_SEPARATORS = re.compile(rb'[ \t\r\n,]*')
+
+def _counted_element_end(buffer, start, scan, depth):
+    """ Finds where the array element at start ends by counting brackets between its candidate closing brackets.
+    Fast, but fooled by brackets inside strings, so the element found must still decode. """
+    closer = b"}" if buffer[start] == ord("{") else b"]"
+    while True:
+        position = buffer.find(closer, scan)
+        if position < 0:
+            return None, scan, depth
+        position += 1
+        depth += (buffer.count(b"{", scan, position) + buffer.count(b"[", scan, position)
+                  - buffer.count(b"}", scan, position) - buffer.count(b"]", scan, position))
+        scan = position
+        if depth == 0:
+            return position, scan, depth
+
+def _scanned_element_end(buffer, start, scan, depth):
+    """ Finds where the array element at start ends by scanning its strings and brackets token by token """
+    for match in _JSON_STRUCTURE_TOKEN.finditer(buffer, scan):
+        token = match.group()
+        if token[:1] == b'"':
+            if match.group(1) is None:
+                # The string goes on in the next chunk: rescan it from its opening quote then
+                return None, match.start(), depth
+        else:
+            depth += 1 if token in b"[{" else -1
+            if depth == 0:
+                return match.end(), match.end(), depth
+    return None, len(buffer), depth
+
+def iter_json_values(chunks, loads=None):
+    """ Decodes a JSON document arriving as byte chunks. The elements of a top-level array, which must be objects
+    or arrays as in Open-Meteo's multi-location responses, are yielded one by one as soon as their last byte
+    arrives, so only the element being received is buffered; any other document is yielded whole at the end. """
+    loads = loads or _json_loads_function()
+    buffer = bytearray()
+    top = None
+    start = None
+    scan = 0
+    depth = 0
+    exact = False
+    for chunk in itertools.chain(chunks, (None,)):
+        at_end = chunk is None
+        if not at_end:
+            buffer += chunk
+        if top is None:
+            stripped = buffer.lstrip()
+            if not stripped:
+                continue
+            top = stripped[:1]
+            if top == b"[":
+                scan = len(buffer) - len(stripped) + 1
+        if top != b"[":
+            continue
+
+        while True:
+            if start is None:
+                scan = _JSON_ELEMENT_SEPARATORS.match(buffer, scan).end()
+                if scan == len(buffer):
+                    break
+                if buffer[scan] == ord("]"):
+                    return
+                if buffer[scan] not in b"{[":
+                    raise ValueError("only arrays of objects or arrays can be decoded incrementally")
+                start, depth, exact = scan, 0, False
+            end, scan, depth = (_scanned_element_end if exact else _counted_element_end)(buffer, start, scan, depth)
+            if end is None:
+                if not exact and (at_end or depth < 0):
+                    # Brackets inside strings threw the count off: rescan the element token by token
+                    exact, scan, depth = True, start, 0
+                    continue
+                break
+            try:
+                value = loads(bytes(buffer[start:end]))
+            except ValueError:
+                if exact:
+                    raise
+                exact, scan, depth = True, start, 0
+                continue
+            yield value
+            start = None
+
+        keep_from = scan if start is None else start
+        del buffer[:keep_from]
+        scan -= keep_from
+        if start is not None:
+            start = 0
+
+    if top is None:
+        raise ValueError("empty JSON response")
+    if top == b"[":
+        raise ValueError("JSON array ended before its closing bracket")
+    yield loads(bytes(buffer))
+
+def decode_json_stream(stage, chunks):
+    """ iter_json_values over one response body; like decode_json, profiling counts it once per body under the
+    upstream stage """
+    yield from iter_json_values(chunks)
+
+def iter_response_chunks(stage, response):
+    """ The body of a streamed response as it downloads; profiled per upstream stage like http_get """
+    yield from response.iter_content(STREAM_CHUNK_BYTES)
+
+def _stage_timeout_seconds(stage):
+    return STAGE_TIMEOUTS[stage][-1]
+
+class SingleFlight:
+    """ Coalesces concurrent calls with the same key so only the first one runs and the rest share its result """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+geocode_flights = SingleFlight()
+forecast_flights = SingleFlight()
+
+def load_config():
+    """ Loads .env into the environment (variables already set win) and returns the OpenWeatherMap API key """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return os.getenv('OPENWEATHERMAP_API_KEY')
+
+def get_cache_dir():
+    return os.getenv(CACHE_DIR_ENV_VAR) or DEFAULT_CACHE_DIR
+
+def normalize_city_query(city_name):
+    return " ".join(str(city_name).split()).casefold()
+
+class GeocodeCache:
+    """ Bounded LRU cache of geocoding results, persisted as JSON between runs """
+
+    def __init__(self, path=None, max_entries=GEOCODE_CACHE_MAX_ENTRIES, ttl_seconds=GEOCODE_CACHE_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+
+    def _get_path(self):
+        return self.path or os.path.join(get_cache_dir(), GEOCODE_CACHE_FILENAME)
+
+    def _load(self):
+        self._loaded = True
+        try:
+            with open(self._get_path(), "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] | Ignoring unreadable geocoding cache '{self._get_path()}': {e}")
+            return
+        now = time.time()
+        for key, entry in stored.get("entries", []):
+            try:
+                lat, lon, display_name, stored_at = entry
+            except (TypeError, ValueError):
+                continue
+            if now - stored_at < self.ttl_seconds:
+                self._entries[key] = (float(lat), float(lon), display_name, stored_at)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        """ Rewrites the cache file if entries were added since it was loaded or last saved """
+        with self._save_lock:
+            with self._lock:
+                if not self._loaded or not self._dirty:
+                    return
+                payload = {"entries": [[key, list(entry)] for key, entry in self._entries.items()]}
+                self._dirty = False
+            path = self._get_path()
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(tmp_path, path)
+            except OSError as e:
+                with self._lock:
+                    self._dirty = True
+                print(f"[WARNING] | Could not write geocoding cache '{path}': {e}")
+
+    def get(self, city_name):
+        key = normalize_city_query(city_name)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[3] >= self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return (entry[0], entry[1]), entry[2]
+
+    def __contains__(self, city_name):
+        key = normalize_city_query(city_name)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            entry = self._entries.get(key)
+            return entry is not None and time.time() - entry[3] < self.ttl_seconds
+
+    def put(self, city_name, coordinates, display_name):
+        key = normalize_city_query(city_name)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            self._entries[key] = (coordinates[0], coordinates[1], display_name, time.time())
+            self._entries.move_to_end(key)
+            self._dirty = True
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loaded = True
+            self._dirty = True
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "max_entries": self.max_entries}
+
+geocode_cache = GeocodeCache()
+
+def get_coordinates(city_name, api_key, use_cache=True):
+    """ Resolves a city from the geocoding cache, then exact matches in the offline city index, then the
+    OpenWeatherMap geocoder, and finally prefix and fuzzy matches in the city index """
+    if use_cache:
+        cached = geocode_cache.get(city_name)
+        if cached is not None:
+            return cached
+
+    # A prefix match ("Bude" -> "Budennovsk") is a guess, so the geocoder gets the first chance to do better
+    local = city_index.lookup(city_name, prefix=False, fuzzy=False)
+    if local is None and api_key:
+        coordinates, resolved_display_name = geocode_flights.do(
+            normalize_city_query(city_name), lambda: _fetch_and_cache_coordinates(city_name, api_key, use_cache))
+        if coordinates:
+            return coordinates, resolved_display_name
+    if local is None:
+        local = city_index.lookup(city_name)
+    if local is None:
+        if not api_key:
+            print(f"[ERROR] | '{city_name}' is not in the offline city index and no OPENWEATHERMAP_API_KEY is set.")
+        return None, city_name
+
+    coordinates, resolved_display_name, match = local
+    if match != "exact":
+        print(f"[WARNING] | No city named exactly '{city_name}'; using the {match} match '{resolved_display_name}'.")
+    return coordinates, resolved_display_name
+
+def _fetch_and_cache_coordinates(city_name, api_key, use_cache):
+    coordinates, resolved_display_name = _fetch_coordinates(city_name, api_key)
+    if use_cache and coordinates:
+        geocode_cache.put(city_name, coordinates, resolved_display_name)
+    return coordinates, resolved_display_name
+
+def prewarm_geocode_cache(city_names, api_key):
+    warmed, failed = 0, []
+    for city_name in city_names:
+        city_name = city_name.strip()
+        if not city_name or city_name.startswith("#"):
+            continue
+        if city_name in geocode_cache:
+            continue
+        with fetch_priority(PRIORITY_BACKGROUND):
+            coordinates, resolved_display_name = _fetch_coordinates(city_name, api_key)
+        if coordinates:
+            geocode_cache.put(city_name, coordinates, resolved_display_name)
+            warmed += 1
+        else:
+            failed.append(city_name)
+    geocode_cache.save()
+    return warmed, failed
+
+def format_cache_stats(stats):
+    served = stats['hits'] + stats.get('stale_hits', 0)
+    lookups = served + stats['misses']
+    hit_rate = (served / lookups * 100) if lookups else 0.0
+    stale_part = f" stale_hits={stats['stale_hits']}" if 'stale_hits' in stats else ""
+    return f"hits={stats['hits']}{stale_part} misses={stats['misses']} hit_rate={hit_rate:.1f}% size={stats['size']}/{stats['max_entries']}"
+
+def _fetch_coordinates(city_name, api_key):
+    import requests
+
     params = {"q": city_name, "limit": 1, "appid": api_key}
     try:
-        response = requests.get(GEOCODING_API_URL, params=params, timeout=API_TIMEOUT)
+        response = http_get(GEOCODING_STAGE, GEOCODING_API_URL, params)
         response.raise_for_status()
-        data = response.json()
+        data = decode_response(GEOCODING_STAGE, response)
 
         if not data:
             print(f"[ERROR] | City '{city_name}' not found or no data returned by geocoding API.")
@@ -184,7 +964,7 @@ def get_coordinates(city_name, api_key):
         return (float(latitude), float(longitude)), resolved_display_name
 
     except requests.exceptions.Timeout:
-        print(f"[ERROR] | Geocoding request for '{city_name}' timed out after {API_TIMEOUT} seconds.")
+        print(f"[ERROR] | Geocoding request for '{city_name}' timed out after {_stage_timeout_seconds(GEOCODING_STAGE)} seconds.")
     except requests.exceptions.HTTPError as e:
         print(f"[ERROR] | HTTP Error in geocoding for '{city_name}': {e.response.status_code} - {e.response.reason}")
     except requests.exceptions.RequestException as e:
@@ -197,36 +977,1322 @@ def get_coordinates(city_name, api_key):
         print(f"[ERROR] | An unexpected error occurred during geocoding for '{city_name}': {e}")
     return None, city_name
 
-def get_weather_data(latitude, longitude):
+def fold_city_name(city_name):
+    """ Case-, accent- and punctuation-insensitive form of a city name, used as the city index key """
+    decomposed = unicodedata.normalize("NFKD", str(city_name).casefold())
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in decomposed if not unicodedata.combining(ch)).split())
+
+def _edit_distance_within(a, b, max_distance):
+    """ Optimal string alignment distance between a and b, or None once it must exceed max_distance """
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+    previous_previous, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return None
+        previous_previous, previous = previous, current
+    return previous[-1] if previous[-1] <= max_distance else None
+
+def build_city_index(cities_path, output_path=None, admin1_path=None, alternate_names=False, min_population=0):
+    """ Builds the offline city index from a GeoNames cities dump (e.g. cities15000.txt) and, optionally, the
+    admin1CodesASCII.txt region names. Returns the number of cities indexed. """
+    admin1_names = {}
+    if admin1_path:
+        with open(admin1_path, "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) >= 2:
+                    admin1_names[fields[0]] = fields[1]
+
+    cities = []
+    with open(cities_path, "r", encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 15:
+                continue
+            try:
+                latitude, longitude = float(fields[4]), float(fields[5])
+                population = int(fields[14] or 0)
+            except ValueError:
+                continue
+            if population < min_population:
+                continue
+            name, ascii_name, country = fields[1], fields[2], fields[8]
+            display_name = ", ".join(part for part in (name, admin1_names.get(f"{country}.{fields[10]}"), country) if part)
+            names = {name, ascii_name}
+            if alternate_names:
+                names.update(alt for alt in fields[3].split(",") if alt and not any(ch.isdigit() for ch in alt))
+            cities.append((population, display_name, latitude, longitude, names, fields[10]))
+
+    # Most populous first, so among cities sharing a key the lowest record number is the best answer
+    cities.sort(key=lambda city: -city[0])
+    coordinates, populations, keyed = array('d'), array('i'), []
+    for record, (population, display_name, latitude, longitude, names, _) in enumerate(cities):
+        coordinates.extend((latitude, longitude))
+        populations.append(min(population, 2 ** 31 - 1))
+        keyed.extend((key, record) for key in {fold_city_name(n) for n in names} if key)
+    keyed.sort()
+
+    sections = {
+        "names": "\n".join(city[1] for city in cities).encode("utf-8"),
+        "region_codes": "\n".join(city[5] for city in cities).encode("utf-8"),
+        "coordinates": coordinates.tobytes(),
+        "populations": populations.tobytes(),
+        "keys": "\n".join(key for key, _ in keyed).encode("utf-8"),
+        "key_records": array('i', (record for _, record in keyed)).tobytes(),
+    }
+    header = {"cities": len(cities), "keys": len(keyed), "sections": [[name, len(data)] for name, data in sections.items()]}
+    output_path = output_path or os.path.join(get_cache_dir(), CITY_INDEX_FILENAME)
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CITY_INDEX_MAGIC)
+        f.write(json.dumps(header).encode("utf-8") + b"\n")
+        for data in sections.values():
+            f.write(data)
+    os.replace(tmp_path, output_path)
+    city_index.reset()
+    return len(cities)
+
+class CityIndex:
+    """ Offline geocoder over a GeoNames cities dump: sorted folded names pointing at population-ranked records """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.hits = {"exact": 0, "prefix": 0, "fuzzy": 0}
+        self.misses = 0
+        self._keys = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _get_path(self):
+        return self.path or os.path.join(get_cache_dir(), CITY_INDEX_FILENAME)
+
+    def reset(self, path=None):
+        with self._lock:
+            self.path = path or self.path
+            self._keys = None
+            self._loaded = False
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            path = self._get_path()
+            try:
+                with open(path, "rb") as f:
+                    if f.readline() != CITY_INDEX_MAGIC:
+                        raise ValueError("not a city index file")
+                    header = json.loads(f.readline())
+                    sections = {name: f.read(length) for name, length in header["sections"]}
+            except FileNotFoundError:
+                return
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"[WARNING] | Ignoring unreadable city index '{path}': {e}")
+                return
+            self._names = sections["names"].decode("utf-8").split("\n")
+            self._region_codes = sections["region_codes"].decode("utf-8").split("\n")
+            self._coordinates = array('d', sections["coordinates"])
+            self._populations = array('i', sections["populations"])
+            self._key_records = array('i', sections["key_records"])
+            self._keys = sections["keys"].decode("utf-8").split("\n") if header["keys"] else []
+
+    def available(self):
+        self._load()
+        return self._keys is not None
+
+    def __len__(self):
+        self._load()
+        return len(self._names) if self._keys is not None else 0
+
+    def _result(self, record):
+        return (self._coordinates[2 * record], self._coordinates[2 * record + 1]), self._names[record]
+
+    def _best_record(self, positions, qualifiers):
+        best = None
+        for position in positions:
+            record = self._key_records[position]
+            if (best is None or record < best) and self._matches_qualifiers(record, qualifiers):
+                best = record
+        return best
+
+    def _matches_qualifiers(self, record, qualifiers):
+        if not qualifiers:
+            return True
+        parts = [fold_city_name(part) for part in self._names[record].split(",")[1:]]
+        region_code = self._region_codes[record].casefold()
+        return all(qualifier == region_code or any(part.startswith(qualifier) for part in parts) for qualifier in qualifiers)
+
+    def _fuzzy_record(self, key, qualifiers):
+        # Typos rarely hit the first letters: try names sharing the first two, then the first one
+        record = self._fuzzy_record_in(key, key[:2], qualifiers)
+        if record is None and len(key) > 1:
+            record = self._fuzzy_record_in(key, key[:1], qualifiers, skip=key[:2])
+        return record
+
+    def _fuzzy_record_in(self, key, prefix, qualifiers, skip=None):
+        max_distance = 1 if len(key) <= 5 else CITY_INDEX_FUZZY_MAX_DISTANCE
+        lo = bisect.bisect_left(self._keys, prefix)
+        hi = bisect.bisect_left(self._keys, prefix + "\uffff", lo)
+        best = None
+        for position in range(lo, hi):
+            candidate = self._keys[position]
+            if abs(len(candidate) - len(key)) > max_distance or (skip and candidate.startswith(skip)):
+                continue
+            distance = _edit_distance_within(key, candidate, max_distance)
+            if distance is None:
+                continue
+            record = self._key_records[position]
+            if (best is None or (distance, record) < best) and self._matches_qualifiers(record, qualifiers):
+                best = (distance, record)
+        return best[1] if best else None
+
+    def lookup(self, city_name, prefix=True, fuzzy=True):
+        """ Returns ((lat, lon), display_name, match) with match "exact", "prefix" or "fuzzy", or None; prefix and
+        fuzzy turn off the looser matches. "Paris, US" style qualifiers must match the region or country of the result. """
+        self._load()
+        if not self._keys:
+            return None
+        parts = [fold_city_name(part) for part in str(city_name).split(",")]
+        key, qualifiers = parts[0], [part for part in parts[1:] if part]
+        if not key:
+            return None
+
+        lo = bisect.bisect_left(self._keys, key)
+        hi = bisect.bisect_right(self._keys, key, lo)
+        record = self._best_record(range(lo, hi), qualifiers)
+        match = "exact"
+        if record is None and prefix and len(key) >= CITY_INDEX_MIN_PREFIX_LENGTH:
+            record = self._best_record(range(hi, bisect.bisect_left(self._keys, key + "\uffff", hi)), qualifiers)
+            match = "prefix"
+        if record is None and fuzzy:
+            record = self._fuzzy_record(key, qualifiers)
+            match = "fuzzy"
+        with self._lock:
+            if record is None:
+                self.misses += 1
+                return None
+            self.hits[match] += 1
+        return self._result(record) + (match,)
+
+    def stats(self):
+        return {"cities": len(self), **self.hits, "misses": self.misses}
+
+city_index = CityIndex()
+
+def parse_sections(sections_text):
+    sections = tuple(part.strip().lower() for part in sections_text.split(",") if part.strip())
+    unknown = [section for section in sections if section not in SECTION_FIELDS]
+    if unknown or not sections:
+        raise ValueError(f"unknown sections {unknown or sections_text!r}, expected a comma-separated subset of {', '.join(DISPLAY_SECTIONS)}")
+    return tuple(section for section in DISPLAY_SECTIONS if section in sections)
+
+def parse_models(models_text):
+    """ "icon_seamless, gfs_seamless" -> ("icon_seamless", "gfs_seamless") """
+    return tuple(dict.fromkeys(part.strip().lower() for part in models_text.split(",") if part.strip()))
+
+def build_weather_params(latitude, longitude, sections=DISPLAY_SECTIONS, model=None):
     params = {
         "latitude": latitude,
         "longitude": longitude,
-        "daily": "precipitation_hours,precipitation_sum,precipitation_probability_max,weather_code,temperature_2m_max,temperature_2m_min,wind_speed_10m_max,wind_gusts_10m_max,wind_direction_10m_dominant,sunrise,sunset,daylight_duration,sunshine_duration,uv_index_max,rain_sum,showers_sum,snowfall_sum,cape_min,cape_max,dew_point_2m_mean,wet_bulb_temperature_2m_mean,wet_bulb_temperature_2m_min,wet_bulb_temperature_2m_max,dew_point_2m_min,dew_point_2m_max,cloud_cover_min,cloud_cover_max,precipitation_probability_mean,snowfall_water_equivalent_sum,updraft_max,winddirection_10m_dominant,wind_gusts_10m_min,wind_speed_10m_min,visibility_min,visibility_max,surface_pressure_max,surface_pressure_min,pressure_msl_max,pressure_msl_min,relative_humidity_2m_max,relative_humidity_2m_min,precipitation_probability_min,pressure_msl_mean,surface_pressure_mean,visibility_mean,wind_gusts_10m_mean,wind_speed_10m_mean,relative_humidity_2m_mean,cape_mean,cloud_cover_mean",
-        "hourly": "temperature_2m,relative_humidity_2m,precipitation_probability,precipitation,rain,showers,snowfall,cloud_cover,dew_point_2m,visibility,evapotranspiration,snow_depth,weather_code,pressure_msl,surface_pressure,wind_speed_10m,wind_direction_10m,wind_gusts_10m,uv_index,freezing_level_height,is_day,wet_bulb_temperature_2m",
-        "models": "best_match",
-        "current": "temperature_2m,relative_humidity_2m,is_day,wind_speed_10m,wind_direction_10m,wind_gusts_10m,precipitation,rain,showers,snowfall,weather_code,cloud_cover,pressure_msl,surface_pressure",
+        "models": model or FORECAST_MODEL,
         "temperature_unit": "celsius",
         "windspeed_unit": "kmh",
         "precipitation_unit": "mm",
         "timezone": "auto"
     }
+    for section in DISPLAY_SECTIONS:
+        if section in sections:
+            params[section] = ",".join(requested_fields(section, sections))
+    if "daily" in sections and "hourly" not in sections and daily_extra_aggregates:
+        params["hourly"] = ",".join(aggregate_sources(daily_extra_aggregates))
+    return params
+
+def requested_fields(section, sections=DISPLAY_SECTIONS):
+    """ Variables to ask the API for in a section. Daily aggregates of hourly variables are left out when the
+    hourly section is fetched too, since they are computed locally from it. """
+    fields = SECTION_FIELDS[section]
+    if section == "daily" and "hourly" in sections:
+        fields = tuple(field for field in fields if field not in LOCAL_DAILY_FIELDS)
+    elif section == "hourly":
+        fields += tuple(source for source in aggregate_sources(daily_extra_aggregates) if source not in fields)
+    return fields
+
+def snap_to_grid(latitude, longitude, resolution=MODEL_GRID_RESOLUTION_DEG):
+    return (round(round(latitude / resolution) * resolution, 6),
+            round(round(longitude / resolution) * resolution, 6))
+
+def model_grid_resolution(model=None):
+    """ Grid spacing in degrees of an Open-Meteo model; for a comma-separated list of models, the finest one """
+    models = str(model or FORECAST_MODEL).split(",")
+    return min(MODEL_GRID_RESOLUTIONS.get(name.strip(), MODEL_GRID_RESOLUTION_DEG) for name in models)
+
+def plan_grid_fetches(coords, model=None):
+    """ Groups (lat, lon) pairs by the model grid cell they fall in. Returns (cells, cell_of): the coordinates to
+    fetch for each distinct cell, which are those of its first location, and the cell index of every input. """
+    resolution = model_grid_resolution(model)
+    cells, positions, cell_of = [], {}, []
+    for lat, lon in coords:
+        cell = snap_to_grid(float(lat), float(lon), resolution)
+        position = positions.get(cell)
+        if position is None:
+            position = positions[cell] = len(cells)
+            cells.append((float(lat), float(lon)))
+        cell_of.append(position)
+    return cells, cell_of
+
+def forecast_cache_key(params, resolution=None):
+    resolution = model_grid_resolution(params.get("models")) if resolution is None else resolution
+    grid_lat, grid_lon = snap_to_grid(float(params["latitude"]), float(params["longitude"]), resolution)
+    request_fields = {k: v for k, v in params.items() if k not in ("latitude", "longitude")}
+    return f"{grid_lat:.4f},{grid_lon:.4f}|{json.dumps(request_fields, sort_keys=True, separators=(',', ':'))}"
+
+def forecast_observed_at(weather_data):
+    """ UTC epoch time of the payload's current observation, or None without a current section """
+    current = (weather_data or {}).get('current') or {}
+    if not current.get('time'):
+        return None
+    observed_local = datetime.fromisoformat(_handle_iso_string_for_datetime(current['time']))
+    if observed_local.tzinfo is None:
+        observed_local = observed_local.replace(tzinfo=timezone.utc)
+    return observed_local.timestamp() - weather_data.get('utc_offset_seconds', 0)
+
+def forecast_expiry(weather_data, now=None):
+    """ Epoch time at which the next model observation is due, falling back to the hourly model cadence """
+    now = time.time() if now is None else now
+    expires_at = now + FORECAST_DEFAULT_TTL_SECONDS
+    current = (weather_data or {}).get('current') or {}
+    interval = current.get('interval')
     try:
-        response = requests.get(WEATHER_API_URL_BASE, params=params, timeout=API_TIMEOUT)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.Timeout:
-        print(f"[ERROR] | Weather data request timed out after {API_TIMEOUT} seconds.")
-    except requests.exceptions.HTTPError as e:
+        if current.get('time') and interval:
+            expires_at = forecast_observed_at(weather_data) + float(interval)
+    except (ValueError, TypeError) as e:
+        print(f"[WARNING] | Could not derive forecast expiry from current time '{current.get('time')}': {e}")
+    return min(max(expires_at, now + FORECAST_MIN_TTL_SECONDS), now + FORECAST_DEFAULT_TTL_SECONDS)
+
+class ForecastCache:
+    """ Grid-keyed forecast response cache with stale-while-revalidate and optional JSON files on disk """
+
+    def __init__(self, max_entries=FORECAST_CACHE_MAX_ENTRIES, stale_grace_seconds=FORECAST_STALE_GRACE_SECONDS, persist=False, directory=None):
+        self.max_entries = max_entries
+        self.stale_grace_seconds = stale_grace_seconds
+        self.persist = persist
+        self.directory = directory
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _get_directory(self):
+        return self.directory or os.path.join(get_cache_dir(), FORECAST_CACHE_DIRNAME)
+
+    def _file_path(self, key):
+        import hashlib
+
+        return os.path.join(self._get_directory(), hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _read_disk(self, key):
+        try:
+            with open(self._file_path(key), "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            return stored["expires_at"], stored["payload"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"[WARNING] | Ignoring unreadable forecast cache entry: {e}")
+            return None
+
+    def _write_disk(self, key, expires_at, payload):
+        path = self._file_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "expires_at": expires_at, "payload": payload}, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[WARNING] | Could not write forecast cache entry '{path}': {e}")
+
+    def lookup(self, key):
+        """ Returns (payload, is_stale) or (None, False) when nothing usable is cached """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self.persist:
+            entry = self._read_disk(key)
+            if entry is not None:
+                with self._lock:
+                    self._store_memory(key, entry[0], entry[1])
+        with self._lock:
+            if entry is not None:
+                expires_at, payload = entry
+                if now < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return payload, False
+                if now < expires_at + self.stale_grace_seconds:
+                    self.stale_hits += 1
+                    return payload, True
+            self.misses += 1
+            return None, False
+
+    def _store_memory(self, key, expires_at, payload):
+        self._entries[key] = (expires_at, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def store(self, key, payload, expires_at=None):
+        expires_at = forecast_expiry(payload) if expires_at is None else expires_at
+        with self._lock:
+            self._store_memory(key, expires_at, payload)
+        if self.persist:
+            self._write_disk(key, expires_at, payload)
+
+    def expires_at(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def begin_refresh(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.stale_hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses,
+                    "size": len(self._entries), "max_entries": self.max_entries}
+
+forecast_cache = ForecastCache()
+
+def _revalidate_forecast(key, params):
+    try:
+        with fetch_priority(PRIORITY_BACKGROUND):
+            weather_data = _fetch_weather_data(params)
+        if weather_data:
+            forecast_cache.store(key, weather_data)
+    finally:
+        forecast_cache.end_refresh(key)
+
+def get_weather_data(latitude, longitude, use_cache=True, sections=DISPLAY_SECTIONS, model=None):
+    params = build_weather_params(latitude, longitude, sections, model)
+    if not use_cache:
+        return _fetch_weather_data(params)
+
+    key = forecast_cache_key(params)
+    cached, is_stale = forecast_cache.lookup(key)
+    if cached is not None:
+        if is_stale and forecast_cache.begin_refresh(key):
+            threading.Thread(target=_revalidate_forecast, args=(key, params), daemon=True).start()
+        return cached
+
+    return forecast_flights.do(key, lambda: _fetch_and_cache_weather_data(key, params))
+
+def refresh_weather_data(latitude, longitude, use_cache=True, sections=DISPLAY_SECTIONS, model=None):
+    """ Always goes upstream (still coalesced), replacing whatever the cache holds for this cell """
+    params = build_weather_params(latitude, longitude, sections, model)
+    if not use_cache:
+        return _fetch_weather_data(params)
+    key = forecast_cache_key(params)
+    return forecast_flights.do(key, lambda: _fetch_and_cache_weather_data(key, params))
+
+def get_ensemble_data(latitude, longitude, models, use_cache=True, sections=DISPLAY_SECTIONS):
+    """ Fetches every model's forecast in parallel and merges them into one Forecast: current conditions come
+    from the first model that answered, the daily series holds the ensemble mean and the hourly series the mean
+    plus its min, max and spread. None when no model answered. """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=len(models)) as executor:
+        payloads = list(executor.map(lambda model: get_weather_data(latitude, longitude, use_cache, sections, model), models))
+    answered = [(model, parse_forecast(weather_data)) for model, weather_data in zip(models, payloads) if weather_data]
+    failed = [model for model, weather_data in zip(models, payloads) if not weather_data]
+    if not answered:
+        return None
+    if failed:
+        print(f"[WARNING] | No forecast from {', '.join(failed)}; the ensemble is built from {len(answered)} of {len(models)} models.")
+    base = answered[0][1]
+    forecasts = [forecast for _, forecast in answered]
+    return Forecast(
+        latitude=base.latitude, longitude=base.longitude, timezone=base.timezone,
+        utc_offset_seconds=base.utc_offset_seconds, elevation=base.elevation,
+        current=base.current, current_units=base.current_units,
+        daily=ensemble_series([forecast.daily for forecast in forecasts], bands=False),
+        hourly=ensemble_series([forecast.hourly for forecast in forecasts]),
+        raw=base.raw, models=tuple(model for model, _ in answered),
+    )
+
+def get_forecast(latitude, longitude, use_cache=True, sections=DISPLAY_SECTIONS, models=None):
+    """ get_weather_data for a single model (the default one when models is empty), or the ensemble of several """
+    if models and len(models) > 1:
+        return get_ensemble_data(latitude, longitude, models, use_cache, sections)
+    return get_weather_data(latitude, longitude, use_cache, sections, models[0] if models else None)
+
+def _fetch_and_cache_weather_data(key, params):
+    weather_data = _fetch_weather_data(params)
+    if weather_data:
+        forecast_cache.store(key, weather_data)
+    return weather_data
+
+def _format_coordinate(value):
+    return f"{float(value):.4f}".rstrip("0").rstrip(".")
+
+def _batch_url_length(batch_coords, sections=DISPLAY_SECTIONS, model=None):
+    params = build_weather_params(",".join(_format_coordinate(lat) for lat, _ in batch_coords),
+                                  ",".join(_format_coordinate(lon) for _, lon in batch_coords), sections, model)
+    return len(WEATHER_API_URL_BASE) + 1 + len(urlencode(params))
+
+def pack_location_batches(coords, sections=DISPLAY_SECTIONS, max_locations=WEATHER_BATCH_MAX_LOCATIONS, max_url_length=WEATHER_BATCH_MAX_URL_LENGTH,
+                          model=None):
+    """ Greedily groups coordinates into batches that fit both the location and URL-length limits """
+    if not coords:
+        return []
+    base_length = _batch_url_length([], sections, model)
+    batches, current, current_length = [], [], base_length
+    for lat, lon in coords:
+        # Each extra location adds both numbers plus an encoded comma separator ("%2C") to each list
+        added_length = len(_format_coordinate(lat)) + len(_format_coordinate(lon)) + (6 if current else 0)
+        if current and (len(current) >= max_locations or current_length + added_length > max_url_length):
+            batches.append(current)
+            current, current_length = [], base_length
+            added_length = len(_format_coordinate(lat)) + len(_format_coordinate(lon))
+        current.append((lat, lon))
+        current_length += added_length
+    batches.append(current)
+    return batches
+
+def _iter_weather_data_batch(batch_coords, sections=DISPLAY_SECTIONS, model=None):
+    """ Yields ((lat, lon), weather_data) for each location of one multi-location request as soon as it has been
+    decoded from the response stream; locations the response does not cover follow with None """
+    params = build_weather_params(",".join(_format_coordinate(lat) for lat, _ in batch_coords),
+                                  ",".join(_format_coordinate(lon) for _, lon in batch_coords), sections, model)
+    yielded, mismatched = 0, False
+    for weather_data in _stream_weather_data(params):
+        if yielded == len(batch_coords) or not isinstance(weather_data, dict):
+            mismatched = True
+            break
+        yield batch_coords[yielded], weather_data
+        yielded += 1
+    if mismatched or yielded != len(batch_coords):
+        print(f"[ERROR] | Weather API response did not match the batch of {len(batch_coords)} locations"
+              + (f" (it ended after {yielded})." if not mismatched else f" (after {yielded} of them)."))
+        for coords in batch_coords[yielded:]:
+            yield coords, None
+
+def _revalidate_forecast_batch(keyed_coords, sections, model=None):
+    try:
+        with fetch_priority(PRIORITY_BACKGROUND):
+            for batch in pack_location_batches([coords for _, coords in keyed_coords], sections, model=model):
+                for (lat, lon), weather_data in _iter_weather_data_batch(batch, sections, model):
+                    if weather_data:
+                        forecast_cache.store(forecast_cache_key(build_weather_params(lat, lon, sections, model)), weather_data)
+    finally:
+        for key, _ in keyed_coords:
+            forecast_cache.end_refresh(key)
+
+def iter_weather_data_many(coords, use_cache=True, sections=DISPLAY_SECTIONS, model=None):
+    """ Fetches forecasts for many (lat, lon) pairs, each grid cell once and in as few requests as possible,
+    yielding (input index, payload) pairs as soon as each cell is served from the cache or decoded from the
+    response stream, so that a consumer which does not keep them only ever holds one location's payload """
+    cells, cell_of = plan_grid_fetches(coords, model)
+    members = [[] for _ in cells]
+    for index, position in enumerate(cell_of):
+        members[position].append(index)
+    cached_cells, missing, stale = [], [], []
+
+    for position, (lat, lon) in enumerate(cells):
+        if use_cache:
+            key = forecast_cache_key(build_weather_params(lat, lon, sections, model))
+            cached, is_stale = forecast_cache.lookup(key)
+            if cached is not None:
+                cached_cells.append((position, cached))
+                if is_stale and forecast_cache.begin_refresh(key):
+                    stale.append((key, (lat, lon)))
+                continue
+        missing.append(position)
+
+    if stale:
+        threading.Thread(target=_revalidate_forecast_batch, args=(stale, sections, model), daemon=True).start()
+    for position, cached in cached_cells:
+        for index in members[position]:
+            yield index, cached
+
+    missing_positions = iter(missing)
+    for batch in pack_location_batches([cells[position] for position in missing], sections, model=model):
+        for (lat, lon), weather_data in _iter_weather_data_batch(batch, sections, model):
+            if weather_data and use_cache:
+                forecast_cache.store(forecast_cache_key(build_weather_params(lat, lon, sections, model)), weather_data)
+            for index in members[next(missing_positions)]:
+                yield index, weather_data
+
+def get_weather_data_many(coords, use_cache=True, sections=DISPLAY_SECTIONS, model=None):
+    """ iter_weather_data_many collected into a list of payloads in input order """
+    results = [None] * len(coords)
+    for index, weather_data in iter_weather_data_many(coords, use_cache, sections, model):
+        results[index] = weather_data
+    return results
+
+_ARCHIVE_RUNS_TABLE = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    cell_lat REAL NOT NULL,
+    cell_lon REAL NOT NULL,
+    issued_at REAL NOT NULL,
+    sections TEXT NOT NULL,
+    model TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    latitude REAL,
+    longitude REAL,
+    timezone TEXT,
+    utc_offset_seconds INTEGER,
+    elevation REAL,
+    units TEXT,
+    -- Also the location / issue time index every query goes through
+    UNIQUE (cell_lat, cell_lon, issued_at, sections, model)
+)"""
+_ARCHIVE_SCHEMA = _ARCHIVE_RUNS_TABLE + """;
+CREATE TABLE IF NOT EXISTS current (run_id INTEGER PRIMARY KEY, time TEXT);
+CREATE TABLE IF NOT EXISTS daily (run_id INTEGER NOT NULL, time TEXT NOT NULL, PRIMARY KEY (run_id, time)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS hourly (run_id INTEGER NOT NULL, time TEXT NOT NULL, PRIMARY KEY (run_id, time)) WITHOUT ROWID;
+"""
+
+class ForecastArchive:
+    """ Append-only SQLite archive of every fetched forecast. Each run is one row keyed by grid cell, issue time
+    and model; its current, daily and hourly values go to one table per section with a column per variable. """
+
+    def __init__(self, path=None, resolution=MODEL_GRID_RESOLUTION_DEG):
+        self.path = path
+        self.resolution = resolution
+        self.appended = 0
+        self._connection = None
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def _get_path(self):
+        return self.path or os.path.join(get_cache_dir(), FORECAST_ARCHIVE_FILENAME)
+
+    def _connect(self):
+        if self._connection is None:
+            import sqlite3
+
+            path = self._get_path()
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            connection = sqlite3.connect(path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_ARCHIVE_SCHEMA)
+            if "model" not in {row[1] for row in connection.execute("PRAGMA table_info(runs)")}:
+                self._add_model_column(connection)
+            for section in DISPLAY_SECTIONS:
+                self._columns[section] = {row[1] for row in connection.execute(f"PRAGMA table_info({section})")}
+            self._connection = connection
+        return self._connection
+
+    @staticmethod
+    def _add_model_column(connection):
+        # Archives written before runs were keyed by model: the model joins the unique key, so the table is rebuilt.
+        # Their runs are labelled with the default model, which served every fetch made without --models.
+        columns = ", ".join(row[1] for row in connection.execute("PRAGMA table_info(runs)"))
+        connection.execute("BEGIN")
+        with connection:
+            connection.execute("ALTER TABLE runs RENAME TO runs_without_model")
+            connection.execute(_ARCHIVE_RUNS_TABLE)
+            connection.execute(f"INSERT INTO runs ({columns}, model) SELECT {columns}, ? FROM runs_without_model", (FORECAST_MODEL,))
+            connection.execute("DROP TABLE runs_without_model")
+
+    @staticmethod
+    def _model_filter(model):
+        """ SQL condition on r.model, and its arguments, for one model name, several, or None for the default model """
+        models = [model or FORECAST_MODEL] if model is None or isinstance(model, str) else list(model)
+        return f"r.model IN ({', '.join('?' * len(models))})", models
+
+    def _add_columns(self, connection, section, names):
+        for name in names:
+            if name not in self._columns[section]:
+                # Untyped columns keep each value exactly as the API sent it (integer, float or text)
+                connection.execute(f'ALTER TABLE {section} ADD COLUMN "{name}"')
+                self._columns[section].add(name)
+
+    def _insert_rows(self, connection, section, run_id, names, rows):
+        names = [name for name in names if name.isidentifier()]
+        self._add_columns(connection, section, names)
+        column_list = "".join(f', "{name}"' for name in names)
+        placeholders = ", ?" * len(names)
+        connection.executemany(f"INSERT INTO {section} (run_id, time{column_list}) VALUES (?, ?{placeholders})",
+                               ((run_id,) + tuple(row) for row in rows))
+
+    def append(self, weather_data, latitude=None, longitude=None, fetched_at=None, model=None):
+        """ Archives one payload of `model` (the default model when None) under the grid cell of (latitude,
+        longitude), defaulting to the payload's own coordinates. Returns the new run id, or None when that run is
+        already archived or could not be written. """
+        import sqlite3
+
+        model = model or FORECAST_MODEL
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        latitude = float(weather_data.get('latitude') if latitude is None else latitude)
+        longitude = float(weather_data.get('longitude') if longitude is None else longitude)
+        try:
+            issued_at = forecast_observed_at(weather_data)
+        except (ValueError, TypeError):
+            issued_at = None
+        # Open-Meteo does not report the model run time; the observation time is the closest proxy
+        issued_at = fetched_at if issued_at is None else issued_at
+        sections = [section for section in DISPLAY_SECTIONS if weather_data.get(section)]
+        if "daily" in sections and "hourly" in sections:
+            # Store the daily aggregates that were computed locally instead of fetched
+            daily = parse_forecast(weather_data).daily
+            weather_data = dict(weather_data, daily=daily.to_dict(), daily_units=daily.units)
+        cell_lat, cell_lon = snap_to_grid(latitude, longitude, self.resolution)
+        units = {section: weather_data.get(f"{section}_units") or {} for section in sections}
+
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    cursor = connection.execute(
+                        "INSERT OR IGNORE INTO runs (cell_lat, cell_lon, issued_at, sections, model, fetched_at, latitude, "
+                        "longitude, timezone, utc_offset_seconds, elevation, units) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (cell_lat, cell_lon, issued_at, ",".join(sections), model, fetched_at, latitude, longitude,
+                         weather_data.get('timezone'), weather_data.get('utc_offset_seconds'), weather_data.get('elevation'),
+                         json.dumps(units, ensure_ascii=False, separators=(",", ":"))))
+                    if cursor.rowcount == 0:
+                        return None
+                    run_id = cursor.lastrowid
+                    for section in sections:
+                        data = weather_data[section]
+                        if section == "current":
+                            names = [key for key, value in data.items() if key != 'time' and not isinstance(value, (list, dict))]
+                            self._insert_rows(connection, section, run_id, names,
+                                              [[data.get('time')] + [data[name] for name in names if name.isidentifier()]])
+                        else:
+                            names = [key for key, values in data.items() if key != 'time' and isinstance(values, list)]
+                            columns = [data[name] for name in names if name.isidentifier()]
+                            self._insert_rows(connection, section, run_id, names, zip(data.get('time') or (), *columns))
+                self.appended += 1
+                return run_id
+        except (sqlite3.Error, OSError) as e:
+            print(f"[WARNING] | Could not archive forecast in '{self._get_path()}': {e}")
+            return None
+
+    def append_response(self, params, weather_data):
+        """ Archives a single or multi-location response under the coordinates that were requested """
+        payloads = weather_data if isinstance(weather_data, list) else [weather_data]
+        latitudes = str(params.get("latitude", "")).split(",")
+        longitudes = str(params.get("longitude", "")).split(",")
+        if len(latitudes) != len(payloads) or len(longitudes) != len(payloads):
+            latitudes = longitudes = [None] * len(payloads)
+        for payload, latitude, longitude in zip(payloads, latitudes, longitudes):
+            if isinstance(payload, dict):
+                self.append(payload, latitude, longitude, model=params.get("models"))
+
+    def _query(self, sql, args):
+        with self._lock:
+            return self._connect().execute(sql, args).fetchall()
+
+    def _existing(self, section, variables):
+        with self._lock:
+            self._connect()
+            return [name for name in variables if name in self._columns[section]]
+
+    @staticmethod
+    def _record(variables, stored, row):
+        record = {"issued_at": row[0], "model": row[1], "time": row[2]}
+        record.update((name, None) for name in variables)
+        record.update(zip(stored, row[3:]))
+        return record
+
+    def runs(self, latitude, longitude, since=None, until=None, model=None):
+        """ Archived runs of a model (a name, several names, or None for the default model) for the grid cell
+        containing (latitude, longitude), oldest first """
+        cell_lat, cell_lon = snap_to_grid(float(latitude), float(longitude), self.resolution)
+        model_filter, models = self._model_filter(model)
+        rows = self._query(
+            "SELECT r.run_id, r.issued_at, r.model, r.fetched_at, r.sections, r.timezone, r.utc_offset_seconds, r.units FROM runs r "
+            f"WHERE r.cell_lat = ? AND r.cell_lon = ? AND r.issued_at >= ? AND r.issued_at < ? AND {model_filter} "
+            "ORDER BY r.issued_at, r.run_id",
+            [cell_lat, cell_lon, -math.inf if since is None else since, math.inf if until is None else until] + models)
+        return [{"run_id": run_id, "issued_at": issued_at, "model": run_model, "fetched_at": fetched_at,
+                 "sections": sections.split(","), "timezone": timezone_name, "utc_offset_seconds": utc_offset,
+                 "units": json.loads(units or "{}")}
+                for run_id, issued_at, run_model, fetched_at, sections, timezone_name, utc_offset, units in rows]
+
+    def forecast_history(self, latitude, longitude, target, section="daily", variables=None, model=None):
+        """ How the forecast for one date (daily) or time step (hourly; a date selects every hour of it) changed
+        across archived runs of a model (as for runs()). Returns dicts with issued_at, model, time and one key per
+        variable, oldest run first. """
+        if section not in ("daily", "hourly"):
+            raise ValueError(f"unknown section {section!r}, expected daily or hourly")
+        target = target.isoformat() if isinstance(target, (date, datetime)) else str(target)
+        last = target + "T99:99" if section == "hourly" and len(target) == 10 else target
+        variables = list(variables or (HISTORY_DAILY_VARIABLES if section == "daily" else HISTORY_HOURLY_VARIABLES))
+        stored = self._existing(section, variables)
+        selected = "".join(f', s."{name}"' for name in stored)
+        cell_lat, cell_lon = snap_to_grid(float(latitude), float(longitude), self.resolution)
+        model_filter, models = self._model_filter(model)
+        rows = self._query(
+            f"SELECT r.issued_at, r.model, s.time{selected} FROM runs r "
+            f"JOIN {section} s ON s.run_id = r.run_id "
+            f"WHERE r.cell_lat = ? AND r.cell_lon = ? AND s.time BETWEEN ? AND ? AND {model_filter} "
+            "ORDER BY r.issued_at, r.model, s.time",
+            [cell_lat, cell_lon, target, last] + models)
+        return [self._record(variables, stored, row) for row in rows]
+
+    def observed(self, latitude, longitude, days=7, variables=None, now=None, model=None):
+        """ Current conditions archived during the last `days` days by a model (as for runs()), one row per model
+        and observation time, oldest first """
+        variables = list(variables or OBSERVED_VARIABLES)
+        stored = self._existing("current", variables)
+        since = (time.time() if now is None else now) - days * SECONDS_PER_DAY
+        selected = "".join(f', c."{name}"' for name in stored)
+        cell_lat, cell_lon = snap_to_grid(float(latitude), float(longitude), self.resolution)
+        model_filter, models = self._model_filter(model)
+        rows = self._query(
+            f"SELECT r.issued_at, r.model, c.time{selected} FROM runs r "
+            "JOIN current c ON c.run_id = r.run_id "
+            f"WHERE r.cell_lat = ? AND r.cell_lon = ? AND r.issued_at >= ? AND {model_filter} ORDER BY r.issued_at, r.run_id",
+            [cell_lat, cell_lon, since] + models)
+        by_time = {}
+        for row in rows:
+            by_time[row[1], row[2]] = self._record(variables, stored, row)
+        return list(by_time.values())
+
+    def stats(self):
+        return {"runs": self._query("SELECT COUNT(*) FROM runs", ())[0][0], "appended": self.appended, "path": self._get_path()}
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+forecast_archive = None
+
+def enable_forecast_archive(path=None):
+    """ Starts archiving every forecast fetched from the API; until then fetches never touch the archive """
+    global forecast_archive
+    if forecast_archive is None or (path and forecast_archive.path != path):
+        forecast_archive = ForecastArchive(path)
+    return forecast_archive
+
+def _print_weather_fetch_error(e):
+    """ Reports a failed forecast request, whichever way its response was being read """
+    import requests
+
+    if isinstance(e, requests.exceptions.Timeout):
+        print(f"[ERROR] | Weather data request timed out after {_stage_timeout_seconds(FORECAST_STAGE)} seconds.")
+    elif isinstance(e, requests.exceptions.HTTPError):
         print(f"[ERROR] | HTTP Error fetching weather data: {e.response.status_code} - {e.response.reason}")
-    except requests.exceptions.RequestException as e:
+    elif isinstance(e, requests.exceptions.RequestException):
         print(f"[ERROR] | Request Exception fetching weather data: {e}")
-    except ValueError as e:
+    elif isinstance(e, ValueError):
         print(f"[ERROR] | Error decoding JSON response from weather API: {e}")
-    except Exception as e:
+    else:
         print(f"[ERROR] | An unexpected error occurred fetching weather data: {e}")
-    return None
 
-def _display_precipitation_details(data_source, units, overall_label_width, indent_string):
+def _fetch_weather_data(params):
+    try:
+        response = http_get(FORECAST_STAGE, WEATHER_API_URL_BASE, params)
+        response.raise_for_status()
+        weather_data = decode_response(FORECAST_STAGE, response)
+    except Exception as e:
+        _print_weather_fetch_error(e)
+        return None
+    if forecast_archive is not None and weather_data:
+        forecast_archive.append_response(params, weather_data)
+    return weather_data
+
+def _stream_weather_data(params):
+    """ Yields each location's payload of a forecast request, decoded from the response stream as soon as it is
+    complete (a single-location response is one payload), archiving it when the archive is on. Errors are
+    printed like _fetch_weather_data's and end the stream early. """
+    latitudes = str(params.get("latitude", "")).split(",")
+    longitudes = str(params.get("longitude", "")).split(",")
+    try:
+        response = http_get(FORECAST_STAGE, WEATHER_API_URL_BASE, params, stream=True)
+        with contextlib.closing(response):
+            response.raise_for_status()
+            for position, weather_data in enumerate(decode_json_stream(FORECAST_STAGE, iter_response_chunks(FORECAST_STAGE, response))):
+                if forecast_archive is not None and isinstance(weather_data, dict):
+                    located = position < len(latitudes) == len(longitudes)
+                    forecast_archive.append(weather_data, latitudes[position] if located else None,
+                                            longitudes[position] if located else None, model=params.get("models"))
+                yield weather_data
+    except Exception as e:
+        _print_weather_fetch_error(e)
+
+SECONDS_PER_DAY = 86400
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def parse_local_timestamp(value):
+    """ Wall-clock seconds since 1970-01-01 for an ISO time, date, datetime or epoch number; offsets are ignored """
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime):
+        return (value.toordinal() - _EPOCH_ORDINAL) * SECONDS_PER_DAY + value.hour * 3600 + value.minute * 60 + value.second
+    if isinstance(value, date):
+        return (value.toordinal() - _EPOCH_ORDINAL) * SECONDS_PER_DAY
+    if len(value) == 16 and value[4] == '-' and value[10] == 'T' and value[13] == ':':
+        day_ordinal = date(int(value[0:4]), int(value[5:7]), int(value[8:10])).toordinal()
+        return (day_ordinal - _EPOCH_ORDINAL) * SECONDS_PER_DAY + int(value[11:13]) * 3600 + int(value[14:16]) * 60
+    if len(value) == 10 and value[4] == '-':
+        return (date(int(value[0:4]), int(value[5:7]), int(value[8:10])).toordinal() - _EPOCH_ORDINAL) * SECONDS_PER_DAY
+    return parse_local_timestamp(datetime.fromisoformat(_handle_iso_string_for_datetime(value)))
+
+def _parse_time_column(times):
+    """ Returns (epochs, is_sorted). Evenly spaced series, which Open-Meteo always returns, are generated
+    from the first step instead of parsing every timestamp. """
+    n = len(times)
+    try:
+        if n >= 3:
+            first, second = parse_local_timestamp(times[0]), parse_local_timestamp(times[1])
+            step = second - first
+            if step > 0 and parse_local_timestamp(times[-1]) == first + (n - 1) * step and \
+               parse_local_timestamp(times[n // 2]) == first + (n // 2) * step:
+                return array('d', range(first, first + n * step, step)), True
+    except (ValueError, TypeError):
+        pass
+
+    epochs = array('d')
+    for t in times:
+        try:
+            epochs.append(parse_local_timestamp(t))
+        except (ValueError, TypeError):
+            epochs.append(math.nan)
+    is_sorted = all(epochs[i] <= epochs[i + 1] for i in range(n - 1))
+    return epochs, is_sorted
+
+def _build_column(values, length):
+    """ Packs one JSON series into a float64 array (NaN for missing) or, for text series, a tuple.
+    The second item records which values were JSON integers so they render exactly as before. """
+    values = list(values[:length]) if values else []
+    if len(values) < length:
+        values.extend([None] * (length - len(values)))
+    present = [v for v in values if v is not None]
+    if any(isinstance(v, str) or isinstance(v, bool) for v in present):
+        return tuple(values), False
+    try:
+        column = array('d', [math.nan if v is None else v for v in values])
+    except TypeError:
+        return tuple(values), False
+    int_count = sum(1 for v in present if isinstance(v, int))
+    if int_count == len(present):
+        return column, True
+    if int_count == 0:
+        return column, False
+    return column, array('b', [isinstance(v, int) for v in values])
+
+class ForecastRow:
+    """ Read-only view of one time step of a ForecastSeries """
+    __slots__ = ('_series', '_index')
+
+    def __init__(self, series, index):
+        self._series = series
+        self._index = index
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def time(self):
+        return self._series.times[self._index]
+
+    def get(self, key, default=None):
+        return self._series.value(key, self._index, default)
+
+    def __getitem__(self, key):
+        if key not in self._series:
+            raise KeyError(key)
+        return self._series.value(key, self._index)
+
+    def to_dict(self):
+        return {key: self._series.value(key, self._index) for key in self._series.keys()}
+
+class ForecastSeries:
+    """ Daily or hourly forecast series parsed once into typed per-variable columns """
+    __slots__ = ('times', 'units', '_columns', '_integral', '_epochs', '_epochs_sorted')
+
+    def __init__(self, times, columns, integral, units):
+        self.times = times
+        self.units = units
+        self._columns = columns
+        self._integral = integral
+        self._epochs = None
+        self._epochs_sorted = False
+
+    @classmethod
+    def from_dict(cls, series_data, units=None):
+        series_data = series_data or {}
+        times = tuple(series_data.get('time') or ())
+        columns, integral = {}, {}
+        for key, values in series_data.items():
+            if key == 'time' or not isinstance(values, list):
+                continue
+            column, int_flags = _build_column(values, len(times))
+            columns[key] = column
+            if int_flags is not False:
+                integral[key] = int_flags
+        return cls(times, columns, integral, dict(units or {}))
+
+    def __len__(self):
+        return len(self.times)
+
+    def __contains__(self, key):
+        return key == 'time' or key in self._columns
+
+    def __iter__(self):
+        return (ForecastRow(self, i) for i in range(len(self.times)))
+
+    def keys(self):
+        return self._columns.keys()
+
+    def row(self, index):
+        return ForecastRow(self, index)
+
+    def column(self, key):
+        """ The raw column: array('d') with NaN for missing numeric values, or a tuple for text """
+        if key == 'time':
+            return self.times
+        return self._columns.get(key)
+
+    def values(self, key, default=None, indices=None):
+        """ The column, or its values at the given indices, as a list of Python values (None for missing),
+        ready for the *_column formatters """
+        if indices is None:
+            indices = range(len(self.times))
+        if key == 'time':
+            return [self.times[i] for i in indices]
+        return [self.value(key, i, default) for i in indices]
+
+    def value(self, key, index, default=None):
+        column = self._columns.get(key)
+        if column is None:
+            return default
+        value = column[index]
+        if value is None or value != value:
+            return default
+        int_flags = self._integral.get(key)
+        if int_flags is True or (int_flags is not None and int_flags[index]):
+            return int(value)
+        return value
+
+    @property
+    def epochs(self):
+        """ Wall-clock epoch seconds of each time step (NaN where unparsable), built on first use """
+        if self._epochs is None:
+            self._epochs, self._epochs_sorted = _parse_time_column(self.times)
+        return self._epochs
+
+    def index_range(self, start=None, end=None):
+        """ Indices of the time steps with start <= time < end; either bound may be omitted """
+        epochs = self.epochs
+        start_epoch = -math.inf if start is None else parse_local_timestamp(start)
+        end_epoch = math.inf if end is None else parse_local_timestamp(end)
+        if self._epochs_sorted:
+            lo = bisect.bisect_left(epochs, start_epoch)
+            return range(lo, max(lo, bisect.bisect_left(epochs, end_epoch, lo)))
+        return [i for i, t in enumerate(epochs) if start_epoch <= t < end_epoch]
+
+    def next_hours(self, start, hours):
+        start_epoch = parse_local_timestamp(start)
+        return self.index_range(start_epoch, start_epoch + hours * 3600)
+
+    def on_date(self, day):
+        day_start = parse_local_timestamp(day)
+        day_start -= day_start % SECONDS_PER_DAY
+        return self.index_range(day_start, day_start + SECONDS_PER_DAY)
+
+    def rest_of_day(self, now):
+        now_epoch = parse_local_timestamp(now)
+        return self.index_range(now_epoch, now_epoch - now_epoch % SECONDS_PER_DAY + SECONDS_PER_DAY)
+
+    def rows(self, indices):
+        return [ForecastRow(self, i) for i in indices]
+
+    def add_column(self, key, column, integral=False, unit=None):
+        """ Adds a column aligned with times, e.g. a locally computed aggregate """
+        self._columns[key] = column
+        if integral is not False:
+            self._integral[key] = integral
+        if unit is not None:
+            self.units.setdefault(key, unit)
+
+    def to_dict(self):
+        series = {'time': list(self.times)}
+        for key in self._columns:
+            series[key] = self.values(key)
+        return series
+
+class Forecast:
+    """ Parsed forecast payload: current conditions plus columnar daily and hourly series """
+    __slots__ = ('latitude', 'longitude', 'timezone', 'utc_offset_seconds', 'elevation',
+                 'current', 'current_units', 'daily', 'hourly', 'raw', 'models')
+
+    def __init__(self, latitude, longitude, timezone, utc_offset_seconds, elevation,
+                 current, current_units, daily, hourly, raw=None, models=None):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.timezone = timezone
+        self.utc_offset_seconds = utc_offset_seconds
+        self.elevation = elevation
+        self.current = current
+        self.current_units = current_units
+        self.daily = daily
+        self.hourly = hourly
+        self.raw = raw
+        # The models merged into an ensemble forecast, None for a single model's payload
+        self.models = models
+
+    @classmethod
+    def from_payload(cls, weather_data):
+        forecast = cls(
+            latitude=weather_data.get('latitude'),
+            longitude=weather_data.get('longitude'),
+            timezone=weather_data.get('timezone'),
+            utc_offset_seconds=weather_data.get('utc_offset_seconds'),
+            elevation=weather_data.get('elevation'),
+            current=dict(weather_data.get('current') or {}),
+            current_units=dict(weather_data.get('current_units') or {}),
+            daily=ForecastSeries.from_dict(weather_data.get('daily'), weather_data.get('daily_units')),
+            hourly=ForecastSeries.from_dict(weather_data.get('hourly'), weather_data.get('hourly_units')),
+            raw=weather_data,
+        )
+        if weather_data.get('daily') and len(forecast.hourly):
+            missing = [name for name in LOCAL_DAILY_FIELDS + daily_extra_aggregates if name not in forecast.daily]
+            if missing:
+                fill_daily_aggregates(forecast.daily, forecast.hourly, missing, forecast.utc_offset_seconds)
+        return forecast
+
+def parse_forecast(weather_data):
+    if weather_data is None or isinstance(weather_data, Forecast):
+        return weather_data
+    return Forecast.from_payload(weather_data)
+
+def _as_series(series_data, units=None):
+    if isinstance(series_data, ForecastSeries):
+        return series_data
+    return ForecastSeries.from_dict(series_data, units)
+
+def _align_series(series, times):
+    """ (columns, integral flags) of a series, rearranged onto another time axis with gaps where it has no data """
+    if series.times == times:
+        return series._columns, series._integral
+    positions = {t: i for i, t in enumerate(series.times)}
+    indices = [positions.get(t) for t in times]
+    columns, integral = {}, {}
+    for key, column in series._columns.items():
+        if isinstance(column, tuple):
+            columns[key] = tuple(None if i is None else column[i] for i in indices)
+        else:
+            columns[key] = array('d', (math.nan if i is None else column[i] for i in indices))
+        if series._integral.get(key) is True:
+            integral[key] = True
+    return columns, integral
+
+def _ensemble_reduce(block):
+    """ Mean, min, max and spread (population standard deviation) across the member columns of a block, per time step """
+    mean, low, high, spread = array('d'), array('d'), array('d'), array('d')
+    for values in zip(*block):
+        values = [value for value in values if value == value]
+        if not values:
+            for column in (mean, low, high, spread):
+                column.append(math.nan)
+            continue
+        average = math.fsum(values) / len(values)
+        mean.append(average)
+        low.append(min(values))
+        high.append(max(values))
+        spread.append(math.sqrt(math.fsum((value - average) ** 2 for value in values) / len(values)))
+    return mean, low, high, spread
+
+def ensemble_series(members, bands=True):
+    """ Merges one ForecastSeries per model onto the first one's time axis. Numeric variables become the ensemble
+    mean and, with bands, <variable>_min, _max and _spread columns; text columns and ENSEMBLE_COPIED_VARIABLES are
+    taken from the first model that has them. """
+    times = members[0].times
+    aligned = [_align_series(member, times) for member in members]
+    keys = list(dict.fromkeys(key for member in members for key in member.keys()))
+    series = ForecastSeries(times, {}, {}, {key: unit for key, unit in members[0].units.items() if key == 'time'})
+    for key in keys:
+        present = [(columns[key], integral.get(key)) for columns, integral in aligned if key in columns]
+        unit = next((member.units[key] for member in members if key in member.units), None)
+        if key in ENSEMBLE_COPIED_VARIABLES or any(isinstance(column, tuple) for column, _ in present):
+            series.add_column(key, present[0][0], present[0][1] or False, unit)
+            continue
+        mean, low, high, spread = _ensemble_reduce([column for column, _ in present])
+        series.add_column(key, mean, False, unit)
+        if bands:
+            integral = all(flag is True for _, flag in present)
+            for statistic, column in zip(ENSEMBLE_STATISTICS, (low, high, spread)):
+                series.add_column(f"{key}_{statistic}", column, integral and statistic != "spread", unit)
+    return series
+
+def heat_index_celsius(temperature, relative_humidity):
+    """ NWS heat index (Rothfusz regression with its low/high humidity adjustments) in °C """
+    if temperature != temperature or relative_humidity != relative_humidity:
+        return math.nan
+    t = temperature * 9 / 5 + 32
+    rh = relative_humidity
+    heat_index = 0.5 * (t + 61.0 + (t - 68.0) * 1.2 + rh * 0.094)
+    if (heat_index + t) / 2 >= 80:
+        heat_index = (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh - 0.00683783 * t * t
+                      - 0.05481717 * rh * rh + 0.00122874 * t * t * rh + 0.00085282 * t * rh * rh
+                      - 0.00000199 * t * t * rh * rh)
+        if rh < 13 and 80 <= t <= 112:
+            heat_index -= (13 - rh) / 4 * math.sqrt((17 - abs(t - 95)) / 17)
+        elif rh > 85 and 80 <= t <= 87:
+            heat_index += (rh - 85) / 10 * (87 - t) / 5
+    return (heat_index - 32) * 5 / 9
+
+def wind_chill_celsius(temperature, wind_speed_kmh):
+    """ North American wind chill index in °C; the air temperature itself above 10 °C or in winds up to 4.8 km/h """
+    if temperature != temperature or wind_speed_kmh != wind_speed_kmh:
+        return math.nan
+    if temperature > 10 or wind_speed_kmh <= 4.8:
+        return temperature
+    wind_factor = wind_speed_kmh ** 0.16
+    return 13.12 + 0.6215 * temperature - 11.37 * wind_factor + 0.3965 * temperature * wind_factor
+
+# Hourly metrics derived from other hourly variables: (function, input variables)
+DERIVED_HOURLY_METRICS = {
+    "heat_index": (heat_index_celsius, ("temperature_2m", "relative_humidity_2m")),
+    "wind_chill": (wind_chill_celsius, ("temperature_2m", "wind_speed_10m")),
+}
+
+def split_aggregate_name(name):
+    """ "pressure_msl_mean" -> ("pressure_msl", "mean") """
+    source, _, reduction = name.rpartition("_")
+    if not source or reduction not in DAILY_REDUCTIONS:
+        raise ValueError(f"{name!r} is not <hourly variable>_<{'|'.join(DAILY_REDUCTIONS)}>")
+    return source, reduction
+
+def aggregate_sources(names):
+    """ Hourly API variables needed to compute the given daily aggregates """
+    sources = []
+    for name in names:
+        source, _ = split_aggregate_name(name)
+        if source not in HOURLY_SECTION_FIELDS and source not in AGGREGATE_EXTRA_HOURLY_VARIABLES and source not in DERIVED_HOURLY_METRICS:
+            raise ValueError(f"unknown hourly variable {source!r} in {name!r}")
+        for variable in DERIVED_HOURLY_METRICS[source][1] if source in DERIVED_HOURLY_METRICS else (source,):
+            if variable not in sources:
+                sources.append(variable)
+    return tuple(sources)
+
+def derived_hourly_column(hourly, name):
+    """ A DERIVED_HOURLY_METRICS column computed over the whole hourly series, or None if an input is missing """
+    function, inputs = DERIVED_HOURLY_METRICS[name]
+    columns = [hourly.column(variable) for variable in inputs]
+    if any(column is None or isinstance(column, tuple) for column in columns):
+        return None
+    return array('d', map(function, *columns))
+
+def local_day_ranges(hourly, utc_offset_seconds=0, days=None):
+    """ (day, indices) for each local calendar day of an hourly series. ISO times are already local; raw unix
+    timestamps are shifted by utc_offset_seconds. days (dates or ISO date strings) picks and orders the days. """
+    offset = (utc_offset_seconds or 0) if hourly.times and isinstance(hourly.times[0], (int, float)) else 0
+    if days is None:
+        valid = [epoch for epoch in hourly.epochs if epoch == epoch]
+        if not valid:
+            return []
+        first, last = ((epoch + offset) // SECONDS_PER_DAY for epoch in (min(valid), max(valid)))
+        day_starts = [day * SECONDS_PER_DAY for day in range(int(first), int(last) + 1)]
+    else:
+        day_starts = []
+        for day in days:
+            try:
+                day_start = parse_local_timestamp(day) + ((utc_offset_seconds or 0) if isinstance(day, (int, float)) else 0)
+            except (ValueError, TypeError):
+                day_start = math.nan
+            day_starts.append(day_start - day_start % SECONDS_PER_DAY)
+    ranges = []
+    for day_start in day_starts:
+        indices = hourly.index_range(day_start - offset, day_start + SECONDS_PER_DAY - offset) if day_start == day_start else ()
+        ranges.append((day_start, indices))
+    return ranges
+
+def _reduce(column, indices, reduction):
+    if isinstance(indices, range) and indices.step == 1:
+        values = column[indices.start:indices.stop]
+    else:
+        values = [column[i] for i in indices]
+    values = [value for value in values if value == value]
+    if not values:
+        return math.nan
+    if reduction == "max":
+        return round(max(values), AGGREGATE_PRECISION)
+    if reduction == "min":
+        return round(min(values), AGGREGATE_PRECISION)
+    total = math.fsum(values)
+    return round(total if reduction == "sum" else total / len(values), AGGREGATE_PRECISION)
+
+def aggregate_daily(hourly, names, utc_offset_seconds=0, days=None):
+    """ Computes daily aggregates named <hourly variable>_<min|max|mean|sum> from an hourly ForecastSeries, over
+    local calendar days. Variables may also be DERIVED_HOURLY_METRICS such as heat_index or wind_chill.
+    Returns a ForecastSeries with one row per day; aggregates whose input is missing are left out. """
+    day_ranges = local_day_ranges(hourly, utc_offset_seconds, days)
+    times = tuple(days) if days is not None else tuple(
+        date.fromordinal(_EPOCH_ORDINAL + int(day_start // SECONDS_PER_DAY)).isoformat() for day_start, _ in day_ranges)
+    series = ForecastSeries(times, {}, {}, {})
+    sources = {}
+    for name in names:
+        source, reduction = split_aggregate_name(name)
+        if source not in sources:
+            if source in DERIVED_HOURLY_METRICS:
+                sources[source] = derived_hourly_column(hourly, source)
+            else:
+                column = hourly.column(source)
+                sources[source] = None if isinstance(column, tuple) else column
+        column = sources[source]
+        if column is None:
+            continue
+        unit_source = DERIVED_HOURLY_METRICS[source][1][0] if source in DERIVED_HOURLY_METRICS else source
+        integral = reduction in ("min", "max") and hourly._integral.get(source) is True
+        series.add_column(name, array('d', (_reduce(column, indices, reduction) for _, indices in day_ranges)),
+                          integral, hourly.units.get(unit_source))
+    return series
+
+def fill_daily_aggregates(daily, hourly, names, utc_offset_seconds=0):
+    """ Adds the named aggregates, computed from hourly, to the daily series in place """
+    aggregated = aggregate_daily(hourly, names, utc_offset_seconds, days=daily.times)
+    for name in aggregated.keys():
+        daily.add_column(name, aggregated.column(name), aggregated._integral.get(name, False), aggregated.units.get(name))
+    return daily
+
+def aggregate_label(name):
+    """ "pressure_msl_mean" -> "Pressure Msl (Mean)" """
+    source, reduction = split_aggregate_name(name)
+    return f"{source.replace('_2m', '').replace('_10m', '').replace('_', ' ').title()} ({reduction.title()})"
+
+daily_extra_aggregates = ()
+
+def configure_daily_aggregates(names):
+    """ Extra daily aggregates (e.g. "heat_index_max", "pressure_msl_mean") to fetch inputs for, compute and show """
+    global daily_extra_aggregates
+    aggregate_sources(names)
+    daily_extra_aggregates = tuple(name for name in names if name not in SECTION_FIELDS["daily"])
+
+def _display_precipitation_details(emit, data_source, units, overall_label_width, indent_string):
     """ Helper to display rain, showers, snowfall if their values are > 0 """
     precip_items = {
         'rain': ('Rain:', units.get('rain', 'mm')),
@@ -238,326 +2304,1315 @@ def _display_precipitation_details(data_source, units, overall_label_width, inde
         value = data_source.get(key)
         if value is not None and isinstance(value, (int, float)) and value > 0:
             effective_label_width = overall_label_width - len(indent_string)
-            print(f"{indent_string}{label:<{effective_label_width}} {format_value_with_unit(value, unit, precision=DEFAULT_PRECISION)}")
+            emit(f"{indent_string}{label:<{effective_label_width}} {format_value_with_unit(value, unit, precision=DEFAULT_PRECISION)}")
             displayed_any = True
     return displayed_any
 
-def display_current_weather(current_data, units, city_display_name):
-    print("\n")
+def _render_current_weather(emit, current_data, units, city_display_name):
+    emit("\n")
     title = f" Current Weather in {city_display_name} "
-    print(title.center(len(LINE_SEPARATOR_MEDIUM), "━"))
+    emit(title.center(len(LINE_SEPARATOR_MEDIUM), "━"))
     
     if not current_data:
-        print("\nNo current weather data available.".center(len(LINE_SEPARATOR_MEDIUM)))
-        print(LINE_SEPARATOR_MEDIUM)
+        emit("\nNo current weather data available.".center(len(LINE_SEPARATOR_MEDIUM)))
+        emit(LINE_SEPARATOR_MEDIUM)
         return
-    print("\n")
+    emit("\n")
 
     label_width = 23
 
-    print(f"{'Time:':<{label_width}} {format_timestamp(current_data.get('time'))}")
+    emit(f"{'Time:':<{label_width}} {format_timestamp(current_data.get('time'))}")
     
     weather_code = current_data.get('weather_code')
-    print(f"{'Condition:':<{label_width}} {get_weather_description(weather_code)}")
+    emit(f"{'Condition:':<{label_width}} {get_weather_description(weather_code)}")
 
     temp_val = current_data.get('temperature_2m')
     temp_unit = units.get('temperature_2m', '°C')
-    print(f"{'Temperature:':<{label_width}} {format_value_with_unit(temp_val, temp_unit, precision=DEFAULT_PRECISION)}")
+    emit(f"{'Temperature:':<{label_width}} {format_value_with_unit(temp_val, temp_unit, precision=DEFAULT_PRECISION)}")
 
     humidity_val = current_data.get('relative_humidity_2m')
     humidity_unit = units.get('relative_humidity_2m', '%')
-    print(f"{'Rel. Humidity:':<{label_width}} {format_value_with_unit(humidity_val, humidity_unit)}")
+    emit(f"{'Rel. Humidity:':<{label_width}} {format_value_with_unit(humidity_val, humidity_unit)}")
     
     precip_val = current_data.get('precipitation')
     precip_unit = units.get('precipitation', 'mm')
-    print(f"{'Total Precipitation:':<{label_width}} {format_value_with_unit(precip_val, precip_unit, precision=DEFAULT_PRECISION, default_val=f'0.0{precip_unit}')}")
+    emit(f"{'Total Precipitation:':<{label_width}} {format_value_with_unit(precip_val, precip_unit, precision=DEFAULT_PRECISION, default_val=f'0.0{precip_unit}')}")
     
     if isinstance(precip_val, (int, float)) and precip_val > 0:
-        _display_precipitation_details(current_data, units, label_width, indent_string="  ↪ ")
+        _display_precipitation_details(emit, current_data, units, label_width, indent_string="  ↪ ")
 
     wind_speed_val = current_data.get('wind_speed_10m')
     wind_speed_unit = units.get('wind_speed_10m', 'km/h')
     wind_dir_deg = current_data.get('wind_direction_10m')
     wind_gusts_val = current_data.get('wind_gusts_10m')
 
-    print(f"{'Wind Speed:':<{label_width}} {format_value_with_unit(wind_speed_val, wind_speed_unit, precision=DEFAULT_PRECISION)}")
-    print(f"{'Wind Direction:':<{label_width}} {degrees_to_cardinal(wind_dir_deg)} ({format_value_with_unit(wind_dir_deg, units.get('wind_direction_10m', '°'), precision=0)})")
+    emit(f"{'Wind Speed:':<{label_width}} {format_value_with_unit(wind_speed_val, wind_speed_unit, precision=DEFAULT_PRECISION)}")
+    emit(f"{'Wind Direction:':<{label_width}} {degrees_to_cardinal(wind_dir_deg)} ({format_value_with_unit(wind_dir_deg, units.get('wind_direction_10m', '°'), precision=0)})")
     if wind_gusts_val is not None and isinstance(wind_gusts_val, (int,float)) and wind_gusts_val > 0:
-        print(f"{'Wind Gusts:':<{label_width}} {format_value_with_unit(wind_gusts_val, units.get('wind_gusts_10m', 'km/h'), precision=DEFAULT_PRECISION)}")
+        emit(f"{'Wind Gusts:':<{label_width}} {format_value_with_unit(wind_gusts_val, units.get('wind_gusts_10m', 'km/h'), precision=DEFAULT_PRECISION)}")
 
     cloud_val = current_data.get('cloud_cover')
     cloud_unit = units.get('cloud_cover', '%')
-    print(f"{'Cloud Cover:':<{label_width}} {format_value_with_unit(cloud_val, cloud_unit)}")
+    emit(f"{'Cloud Cover:':<{label_width}} {format_value_with_unit(cloud_val, cloud_unit)}")
 
     pressure_msl_val = current_data.get('pressure_msl')
     pressure_msl_unit = units.get('pressure_msl', 'hPa')
-    print(f"{'Pressure (MSL):':<{label_width}} {format_value_with_unit(pressure_msl_val, pressure_msl_unit, precision=1)}")
+    emit(f"{'Pressure (MSL):':<{label_width}} {format_value_with_unit(pressure_msl_val, pressure_msl_unit, precision=1)}")
 
     surface_pressure_val = current_data.get('surface_pressure')
     surface_pressure_unit = units.get('surface_pressure', 'hPa')
-    print(f"{'Surface Pressure:':<{label_width}} {format_value_with_unit(surface_pressure_val, surface_pressure_unit, precision=1)}")
+    emit(f"{'Surface Pressure:':<{label_width}} {format_value_with_unit(surface_pressure_val, surface_pressure_unit, precision=1)}")
     
     is_day_val = current_data.get('is_day')
     is_day_str = 'Day ☀️' if is_day_val == 1 else 'Night 🌙' if is_day_val == 0 else DEFAULT_NA
-    print(f"{'Day/Night:':<{label_width}} {is_day_str}")
+    emit(f"{'Day/Night:':<{label_width}} {is_day_str}")
 
-def display_daily_weather(daily_data, units):
-    print("\n")
+def ensemble_percent_precision(series, models=None):
+    """ Precision for whole-percent variables: an ensemble's means are rounded like single-model values, which
+    are shown as they come. A series is an ensemble when models are given or it carries spread columns. """
+    if models or any(key.endswith("_spread") for key in series.keys()):
+        return 0
+    return None
+
+def _render_daily_weather(emit, daily_data, units, models=None):
+    emit("\n")
     title = " Daily Forecast "
-    print(title.center(len(LINE_SEPARATOR_LONG), "━"))
+    emit(title.center(len(LINE_SEPARATOR_LONG), "━"))
     
-    if not daily_data or not daily_data.get('time'):
-        print("\nNo daily forecast data available.".center(len(LINE_SEPARATOR_LONG)))
-        print(LINE_SEPARATOR_LONG)
+    daily_series = _as_series(daily_data, units)
+    if not len(daily_series):
+        emit("\nNo daily forecast data available.".center(len(LINE_SEPARATOR_LONG)))
+        emit(LINE_SEPARATOR_LONG)
         return
-    print("\n")
+    emit("\n")
 
     label_width = 28
     indent = "  "
     sub_indent = indent + "  "
     effective_sub_label_width = label_width - len(sub_indent)
 
-    times = daily_data.get('time', [])
+    times = daily_series.times
+    percent_precision = ensemble_percent_precision(daily_series, models)
+    # Whole columns are formatted up front; the loop below only assembles the lines of each day
+    date_labels = format_daily_date_column(times)
+    conditions = weather_description_column(daily_series.values('weather_code'))
+    temp_unit = units.get('temperature_2m_max', '°C')
+    temp_max_labels = format_value_column(daily_series.values('temperature_2m_max'), temp_unit, precision=DEFAULT_PRECISION)
+    temp_min_labels = format_value_column(daily_series.values('temperature_2m_min'), temp_unit, precision=DEFAULT_PRECISION)
+    precip_sum_unit = units.get('precipitation_sum', 'mm')
+    precip_sum_labels = format_value_column(daily_series.values('precipitation_sum'), precip_sum_unit,
+                                            precision=DEFAULT_PRECISION, default_val=f'0.0{precip_sum_unit}')
+    precip_prob_labels = format_value_column(daily_series.values('precipitation_probability_max'),
+                                             units.get('precipitation_probability_max', '%'), precision=percent_precision)
+    precip_hours_labels = format_value_column(daily_series.values('precipitation_hours'),
+                                              units.get('precipitation_hours', 'h'), precision=0)
+    sunrise_labels = format_timestamp_column(daily_series.values('sunrise'), TIME_ONLY_FORMAT)
+    sunset_labels = format_timestamp_column(daily_series.values('sunset'), TIME_ONLY_FORMAT)
+    uv_labels = format_value_column(daily_series.values('uv_index_max'), units.get('uv_index_max', ''), precision=DEFAULT_PRECISION)
+    wind_speed_labels = format_value_column(daily_series.values('wind_speed_10m_max'),
+                                            units.get('wind_speed_10m_max', 'km/h'), precision=DEFAULT_PRECISION)
+    wind_dir_values = daily_series.values('wind_direction_10m_dominant')
+    wind_dir_cardinals = degrees_to_cardinal_column(wind_dir_values)
+    wind_dir_labels = format_value_column(wind_dir_values, units.get('wind_direction_10m_dominant', '°'), precision=0)
+    dew_point_labels = format_value_column(daily_series.values('dew_point_2m_mean'), units.get('dew_point_2m_mean', '°C'),
+                                           precision=DEFAULT_PRECISION)
+    visibility_labels = format_visibility_column(daily_series.values('visibility_mean'), units.get('visibility_mean', 'm'))
 
     for i in range(len(times)):
         try:
-            date_str = format_daily_date(times[i])
-            print(f"📅 {date_str}:")
+            emit(f"📅 {date_labels[i]}:")
 
-            def get_daily_val(key): 
-                data_array = daily_data.get(key, [])
-                return data_array[i] if data_array and i < len(data_array) else None
+            daily_row = daily_series.row(i)
 
-            weather_code = get_daily_val('weather_code')
-            print(f"{indent}{'Condition:':<{label_width-len(indent)}} {get_weather_description(weather_code)}")
+            emit(f"{indent}{'Condition:':<{label_width-len(indent)}} {conditions[i]}")
+            emit(f"{indent}{'Temp (Max/Min):':<{label_width-len(indent)}} {temp_max_labels[i]} / {temp_min_labels[i]}")
 
-            temp_max = get_daily_val('temperature_2m_max')
-            temp_min = get_daily_val('temperature_2m_min')
-            temp_unit = units.get('temperature_2m_max', '°C')
-            print(f"{indent}{'Temp (Max/Min):':<{label_width-len(indent)}} {format_value_with_unit(temp_max, temp_unit, precision=DEFAULT_PRECISION)} / {format_value_with_unit(temp_min, temp_unit, precision=DEFAULT_PRECISION)}")
-
-            precip_sum_val = get_daily_val('precipitation_sum')
-            precip_sum_unit = units.get('precipitation_sum', 'mm')
-            precip_prob_max = get_daily_val('precipitation_probability_max')
-            precip_prob_unit = units.get('precipitation_probability_max', '%')
-            precip_hours = get_daily_val('precipitation_hours')
-            precip_hours_unit = units.get('precipitation_hours', 'h')
-
-            print(f"{indent}{'Precip Sum:':<{label_width-len(indent)}} {format_value_with_unit(precip_sum_val, precip_sum_unit, precision=DEFAULT_PRECISION, default_val=f'0.0{precip_sum_unit}')}")
+            precip_sum_val = daily_row.get('precipitation_sum')
+            emit(f"{indent}{'Precip Sum:':<{label_width-len(indent)}} {precip_sum_labels[i]}")
             if isinstance(precip_sum_val, (int,float)) and precip_sum_val > 0:
-                rain_s = get_daily_val('rain_sum')
-                showers_s = get_daily_val('showers_sum')
-                snowfall_s = get_daily_val('snowfall_sum')
-                if rain_s is not None and float(rain_s) > 0: print(f"{sub_indent}{'Rain:':<{effective_sub_label_width}} {format_value_with_unit(rain_s, units.get('rain_sum', 'mm'), precision=DEFAULT_PRECISION)}")
-                if showers_s is not None and float(showers_s) > 0: print(f"{sub_indent}{'Showers:':<{effective_sub_label_width}} {format_value_with_unit(showers_s, units.get('showers_sum', 'mm'), precision=DEFAULT_PRECISION)}")
-                if snowfall_s is not None and float(snowfall_s) > 0: print(f"{sub_indent}{'Snowfall:':<{effective_sub_label_width}} {format_value_with_unit(snowfall_s, units.get('snowfall_sum', 'cm'), precision=DEFAULT_PRECISION)}")
+                rain_s = daily_row.get('rain_sum')
+                showers_s = daily_row.get('showers_sum')
+                snowfall_s = daily_row.get('snowfall_sum')
+                if rain_s is not None and float(rain_s) > 0: emit(f"{sub_indent}{'Rain:':<{effective_sub_label_width}} {format_value_with_unit(rain_s, units.get('rain_sum', 'mm'), precision=DEFAULT_PRECISION)}")
+                if showers_s is not None and float(showers_s) > 0: emit(f"{sub_indent}{'Showers:':<{effective_sub_label_width}} {format_value_with_unit(showers_s, units.get('showers_sum', 'mm'), precision=DEFAULT_PRECISION)}")
+                if snowfall_s is not None and float(snowfall_s) > 0: emit(f"{sub_indent}{'Snowfall:':<{effective_sub_label_width}} {format_value_with_unit(snowfall_s, units.get('snowfall_sum', 'cm'), precision=DEFAULT_PRECISION)}")
             
-            print(f"{indent}{'Precip Probability (Max):':<{label_width-len(indent)}} {format_value_with_unit(precip_prob_max, precip_prob_unit)}")
-            print(f"{indent}{'Precip Hours:':<{label_width-len(indent)}} {format_value_with_unit(precip_hours, precip_hours_unit, precision=0)}")
+            emit(f"{indent}{'Precip Probability (Max):':<{label_width-len(indent)}} {precip_prob_labels[i]}")
+            emit(f"{indent}{'Precip Hours:':<{label_width-len(indent)}} {precip_hours_labels[i]}")
 
 
-            print(f"{indent}{'Sunrise / Sunset:':<{label_width-len(indent)}} {format_time_from_iso(get_daily_val('sunrise'))} 🌅 / {format_time_from_iso(get_daily_val('sunset'))} 🌇")
-            print(f"{indent}{'Daylight / Sunshine:':<{label_width-len(indent)}} {format_duration(get_daily_val('daylight_duration'))} / {format_duration(get_daily_val('sunshine_duration'))}")
+            emit(f"{indent}{'Sunrise / Sunset:':<{label_width-len(indent)}} {sunrise_labels[i]} 🌅 / {sunset_labels[i]} 🌇")
+            emit(f"{indent}{'Daylight / Sunshine:':<{label_width-len(indent)}} {format_duration(daily_row.get('daylight_duration'))} / {format_duration(daily_row.get('sunshine_duration'))}")
             
-            print(f"{indent}{'Max UV Index:':<{label_width-len(indent)}} {format_value_with_unit(get_daily_val('uv_index_max'), units.get('uv_index_max', ''), precision=DEFAULT_PRECISION)}")
+            emit(f"{indent}{'Max UV Index:':<{label_width-len(indent)}} {uv_labels[i]}")
 
-            wind_speed_max = get_daily_val('wind_speed_10m_max')
-            wind_speed_unit = units.get('wind_speed_10m_max', 'km/h')
-            wind_gusts_max = get_daily_val('wind_gusts_10m_max')
-            wind_dir_deg = get_daily_val('wind_direction_10m_dominant')
-            
-            print(f"{indent}{'Wind Speed (Max):':<{label_width-len(indent)}} {format_value_with_unit(wind_speed_max, wind_speed_unit, precision=DEFAULT_PRECISION)}")
+            wind_gusts_max = daily_row.get('wind_gusts_10m_max')
+            emit(f"{indent}{'Wind Speed (Max):':<{label_width-len(indent)}} {wind_speed_labels[i]}")
             if wind_gusts_max is not None and isinstance(wind_gusts_max, (int,float)) and wind_gusts_max > 0:
-                 print(f"{indent}{'Wind Gusts (Max):':<{label_width-len(indent)}} {format_value_with_unit(wind_gusts_max, units.get('wind_gusts_10m_max', 'km/h'), precision=DEFAULT_PRECISION)}")
-            print(f"{indent}{'Dominant Wind Dir:':<{label_width-len(indent)}} {degrees_to_cardinal(wind_dir_deg)} ({format_value_with_unit(wind_dir_deg, units.get('wind_direction_10m_dominant', '°'), precision=0)})")
+                 emit(f"{indent}{'Wind Gusts (Max):':<{label_width-len(indent)}} {format_value_with_unit(wind_gusts_max, units.get('wind_gusts_10m_max', 'km/h'), precision=DEFAULT_PRECISION)}")
+            emit(f"{indent}{'Dominant Wind Dir:':<{label_width-len(indent)}} {wind_dir_cardinals[i]} ({wind_dir_labels[i]})")
 
-            dew_point_mean = get_daily_val('dew_point_2m_mean')
-            dew_point_unit = units.get('dew_point_2m_mean', '°C')
-            print(f"{indent}{'Dew Point (Mean):':<{label_width-len(indent)}} {format_value_with_unit(dew_point_mean, dew_point_unit, precision=DEFAULT_PRECISION)}")
+            emit(f"{indent}{'Dew Point (Mean):':<{label_width-len(indent)}} {dew_point_labels[i]}")
+            emit(f"{indent}{'Visibility (Mean):':<{label_width-len(indent)}} {visibility_labels[i]}")
 
-            vis_mean = get_daily_val('visibility_mean')
-            vis_unit = units.get('visibility_mean', 'm')
-            print(f"{indent}{'Visibility (Mean):':<{label_width-len(indent)}} {format_visibility_km(vis_mean, vis_unit)}")
+            for name in daily_extra_aggregates:
+                if name in daily_series:
+                    emit(f"{indent}{aggregate_label(name) + ':':<{label_width-len(indent)}} {format_value_with_unit(daily_row.get(name), units.get(name, ''), precision=DEFAULT_PRECISION)}")
 
         except (IndexError, KeyError) as e:
-            print(f"{indent}[WARN] | Incomplete data for day index {i}: {e}")
+            emit(f"{indent}[WARN] | Incomplete data for day index {i}: {e}")
         except Exception as e:
-            print(f"{indent}[WARN] | Error processing data for day index {i}: {e}")
+            emit(f"{indent}[WARN] | Error processing data for day index {i}: {e}")
         
         if i < len(times) - 1:
-            print(LINE_SEPARATOR_MEDIUM.center(len(LINE_SEPARATOR_LONG)))
-
-def display_hourly_weather(hourly_data, units, current_time_iso_str):
-    print("\n")
+            emit(LINE_SEPARATOR_MEDIUM.center(len(LINE_SEPARATOR_LONG)))
+
+def _ensemble_band(row, key, unit, precision=None):
+    """ " [min – max, ±spread]" for ensemble series, empty for a single model """
+    low, high, spread = (row.get(f"{key}_{statistic}") for statistic in ENSEMBLE_STATISTICS)
+    if low is None or high is None:
+        return ""
+    band = f" [{format_value_with_unit(low, '', precision=precision)} – {format_value_with_unit(high, unit, precision=precision)}"
+    return band + (f", ±{format_value_with_unit(spread, '', precision=DEFAULT_PRECISION)}]" if spread is not None else "]")
+
+def _render_hourly_weather(emit, hourly_data, units, current_time_iso_str, models=None):
+    emit("\n")
     title = " Hourly Forecast (Rest of the day) "
-    print(title.center(len(LINE_SEPARATOR_LONG), "━"))
+    emit(title.center(len(LINE_SEPARATOR_LONG), "━"))
     
-    if not hourly_data or not hourly_data.get('time'):
-        print("\nNo hourly forecast data available.".center(len(LINE_SEPARATOR_LONG)))
-        print(LINE_SEPARATOR_LONG)
+    hourly_series = _as_series(hourly_data, units)
+    if not len(hourly_series):
+        emit("\nNo hourly forecast data available.".center(len(LINE_SEPARATOR_LONG)))
+        emit(LINE_SEPARATOR_LONG)
         return
-    print("\n")
+    emit("\n")
 
-    current_dt_obj, end_of_today_dt = None, None
+    current_epoch = None
     try:
         if not current_time_iso_str or current_time_iso_str == DEFAULT_NA:
             raise ValueError("Invalid current time provided for hourly forecast filtering.")
-        
-        processed_current_iso = _handle_iso_string_for_datetime(current_time_iso_str)
-        current_dt_obj = datetime.fromisoformat(processed_current_iso)
-        end_of_today_dt = datetime(current_dt_obj.year, current_dt_obj.month, current_dt_obj.day, tzinfo=current_dt_obj.tzinfo) + timedelta(days=1)
+        current_epoch = parse_local_timestamp(current_time_iso_str)
 
     except (ValueError, TypeError) as e:
-        print(f"[WARNING] | Could not parse current time '{current_time_iso_str}' for hourly filtering: {e}. Showing limited forecast.")
+        emit(f"[WARNING] | Could not parse current time '{current_time_iso_str}' for hourly filtering: {e}. Showing limited forecast.")
 
     label_width = 26
     indent = "  "
     sub_item_indent = indent + "  ↪ "
     effective_sub_label_width = label_width - len(sub_item_indent)
 
-    hourly_times = hourly_data.get('time', [])
+    hourly_times = hourly_series.times
     displayed_count = 0
     max_display_fallback = 8
-
-    for i in range(len(hourly_times)):
+    percent_precision = ensemble_percent_precision(hourly_series, models)
+
+    if current_epoch is not None:
+        display_indices = hourly_series.rest_of_day(current_epoch)
+        if not display_indices:
+            # Nothing left today: show the first hour of tomorrow rather than an empty section
+            next_index = bisect.bisect_left(hourly_series.epochs, current_epoch) if isinstance(display_indices, range) else len(hourly_times)
+            display_indices = range(next_index, min(next_index + 1, len(hourly_times)))
+    else:
+        display_indices = range(min(max_display_fallback, len(hourly_times)))
+
+    # Format the displayed hours column by column; position counts the displayed hours
+    column = lambda key: hourly_series.values(key, indices=display_indices)
+    time_labels = format_timestamp_column(column('time'), TIME_ONLY_FORMAT)
+    conditions = weather_description_column(column('weather_code'))
+    temp_unit_hr = units.get('temperature_2m', '°C')
+    temperature_labels = format_value_column(column('temperature_2m'), temp_unit_hr, precision=DEFAULT_PRECISION)
+    humidity_labels = format_value_column(column('relative_humidity_2m'), units.get('relative_humidity_2m', '%'), precision=percent_precision)
+    dew_point_labels = format_value_column(column('dew_point_2m'), units.get('dew_point_2m', '°C'), precision=DEFAULT_PRECISION)
+    precip_prob_unit = units.get('precipitation_probability', '%')
+    precip_prob_labels = format_value_column(column('precipitation_probability'), precip_prob_unit, precision=percent_precision)
+    precip_unit_hr = units.get('precipitation', 'mm')
+    precip_labels = format_value_column(column('precipitation'), precip_unit_hr, precision=DEFAULT_PRECISION, default_val=f'0.0{precip_unit_hr}')
+    visibility_labels = format_visibility_column(column('visibility'), units.get('visibility', 'm'))
+    cloud_cover_unit = units.get('cloud_cover', '%')
+    cloud_cover_labels = format_value_column(column('cloud_cover'), cloud_cover_unit, precision=percent_precision)
+    wind_speed_unit_hr = units.get('wind_speed_10m', 'km/h')
+    wind_speed_labels = format_value_column(column('wind_speed_10m'), wind_speed_unit_hr, precision=DEFAULT_PRECISION)
+    wind_dir_values = column('wind_direction_10m')
+    wind_dir_cardinals = degrees_to_cardinal_column(wind_dir_values)
+    wind_dir_labels = format_value_column(wind_dir_values, units.get('wind_direction_10m', '°'), precision=0)
+    uv_labels = format_value_column(column('uv_index'), units.get('uv_index', ''), precision=DEFAULT_PRECISION)
+    pressure_labels = format_value_column(column('pressure_msl'), units.get('pressure_msl', 'hPa'), precision=1)
+    freezing_level_labels = format_value_column(column('freezing_level_height'), units.get('freezing_level_height', 'm'), precision=0)
+    wet_bulb_labels = format_value_column(column('wet_bulb_temperature_2m'), units.get('wet_bulb_temperature_2m', '°C'), precision=DEFAULT_PRECISION)
+
+    for position, i in enumerate(display_indices):
         try:
             hourly_time_iso = hourly_times[i]
-            processed_hourly_iso = _handle_iso_string_for_datetime(hourly_time_iso)
-            hourly_dt = datetime.fromisoformat(processed_hourly_iso)
-
-            if current_dt_obj and end_of_today_dt:
-                if not (current_dt_obj <= hourly_dt < end_of_today_dt):
-                    if hourly_dt >= end_of_today_dt and displayed_count > 0: break
-                    if hourly_dt < current_dt_obj : continue
-            elif displayed_count >= max_display_fallback:
-                break
-            
-            print(f"🕒 {format_time_from_iso(hourly_time_iso)}:")
+            emit(f"🕒 {time_labels[position]}:")
             displayed_count += 1
 
-            def get_hourly_val(key, idx):
-                series = hourly_data.get(key)
-                return series[idx] if series and idx < len(series) else None
-
-            weather_code_hr = get_hourly_val('weather_code',i)
-            print(f"{indent}{'Condition:':<{label_width-len(indent)}} {get_weather_description(weather_code_hr)}")
+            hourly_row = hourly_series.row(i)
 
-            print(f"{indent}{'Temperature:':<{label_width-len(indent)}} {format_value_with_unit(get_hourly_val('temperature_2m',i), units.get('temperature_2m', '°C'), precision=DEFAULT_PRECISION)}")
-            print(f"{indent}{'Rel. Humidity:':<{label_width-len(indent)}} {format_value_with_unit(get_hourly_val('relative_humidity_2m',i), units.get('relative_humidity_2m', '%'))}")
-            print(f"{indent}{'Dew Point:':<{label_width-len(indent)}} {format_value_with_unit(get_hourly_val('dew_point_2m',i), units.get('dew_point_2m', '°C'), precision=DEFAULT_PRECISION)}")
-            
-            precip_prob_hr = get_hourly_val('precipitation_probability',i)
-            precip_prob_unit = units.get('precipitation_probability', '%')
-            print(f"{indent}{'Precip. Probability:':<{label_width-len(indent)}} {format_value_with_unit(precip_prob_hr, precip_prob_unit)}")
+            emit(f"{indent}{'Condition:':<{label_width-len(indent)}} {conditions[position]}")
+            emit(f"{indent}{'Temperature:':<{label_width-len(indent)}} {temperature_labels[position]}{_ensemble_band(hourly_row, 'temperature_2m', temp_unit_hr, DEFAULT_PRECISION)}")
+            emit(f"{indent}{'Rel. Humidity:':<{label_width-len(indent)}} {humidity_labels[position]}")
+            emit(f"{indent}{'Dew Point:':<{label_width-len(indent)}} {dew_point_labels[position]}")
+            emit(f"{indent}{'Precip. Probability:':<{label_width-len(indent)}} {precip_prob_labels[position]}{_ensemble_band(hourly_row, 'precipitation_probability', precip_prob_unit, percent_precision)}")
 
-            total_precip_hr = get_hourly_val('precipitation',i)
-            precip_unit_hr = units.get('precipitation', 'mm')
-            print(f"{indent}{'Total Precipitation:':<{label_width-len(indent)}} {format_value_with_unit(total_precip_hr, precip_unit_hr, precision=DEFAULT_PRECISION, default_val=f'0.0{precip_unit_hr}')}")
+            total_precip_hr = hourly_row.get('precipitation')
+            emit(f"{indent}{'Total Precipitation:':<{label_width-len(indent)}} {precip_labels[position]}{_ensemble_band(hourly_row, 'precipitation', precip_unit_hr, DEFAULT_PRECISION)}")
             
             if isinstance(total_precip_hr, (int, float)) and total_precip_hr > 0:
                 current_hour_precip_data = {
-                    'rain': get_hourly_val('rain', i),
-                    'showers': get_hourly_val('showers', i),
-                    'snowfall': get_hourly_val('snowfall', i)
+                    'rain': hourly_row.get('rain'),
+                    'showers': hourly_row.get('showers'),
+                    'snowfall': hourly_row.get('snowfall')
                 }
-                _display_precipitation_details(current_hour_precip_data, units, label_width, indent_string=sub_item_indent)
+                _display_precipitation_details(emit, current_hour_precip_data, units, label_width, indent_string=sub_item_indent)
             
-            snow_depth_val = get_hourly_val('snow_depth', i)
+            snow_depth_val = hourly_row.get('snow_depth')
             if snow_depth_val is not None and isinstance(snow_depth_val, (int, float)) and snow_depth_val > 0:
                 snow_depth_unit = units.get('snow_depth', 'm')
                 if snow_depth_unit == 'm' and snow_depth_val < 1 and snow_depth_val > 0:
-                    print(f"{indent}{'Snow Depth:':<{label_width-len(indent)}} {format_value_with_unit(snow_depth_val * 100, 'cm', precision=1)}")
+                    emit(f"{indent}{'Snow Depth:':<{label_width-len(indent)}} {format_value_with_unit(snow_depth_val * 100, 'cm', precision=1)}")
                 else:
-                    print(f"{indent}{'Snow Depth:':<{label_width-len(indent)}} {format_value_with_unit(snow_depth_val, snow_depth_unit, precision=2)}")
+                    emit(f"{indent}{'Snow Depth:':<{label_width-len(indent)}} {format_value_with_unit(snow_depth_val, snow_depth_unit, precision=2)}")
 
-            visibility_m_hr = get_hourly_val('visibility',i)
-            vis_unit_hr = units.get('visibility','m')
-            print(f"{indent}{'Visibility:':<{label_width-len(indent)}} {format_visibility_km(visibility_m_hr, vis_unit_hr)}")
-
-            print(f"{indent}{'Cloud Cover:':<{label_width-len(indent)}} {format_value_with_unit(get_hourly_val('cloud_cover',i), units.get('cloud_cover', '%'))}")
-            
-            print(f"{indent}{'Wind Speed:':<{label_width-len(indent)}} {format_value_with_unit(get_hourly_val('wind_speed_10m',i), units.get('wind_speed_10m', 'km/h'), precision=DEFAULT_PRECISION)}")
-            wind_dir_deg_hr = get_hourly_val('wind_direction_10m',i)
-            print(f"{indent}{'Wind Direction:':<{label_width-len(indent)}} {degrees_to_cardinal(wind_dir_deg_hr)} ({format_value_with_unit(wind_dir_deg_hr, units.get('wind_direction_10m', '°'), precision=0)})")
+            emit(f"{indent}{'Visibility:':<{label_width-len(indent)}} {visibility_labels[position]}")
+            emit(f"{indent}{'Cloud Cover:':<{label_width-len(indent)}} {cloud_cover_labels[position]}{_ensemble_band(hourly_row, 'cloud_cover', cloud_cover_unit, percent_precision)}")
+            emit(f"{indent}{'Wind Speed:':<{label_width-len(indent)}} {wind_speed_labels[position]}{_ensemble_band(hourly_row, 'wind_speed_10m', wind_speed_unit_hr, DEFAULT_PRECISION)}")
+            emit(f"{indent}{'Wind Direction:':<{label_width-len(indent)}} {wind_dir_cardinals[position]} ({wind_dir_labels[position]})")
             
-            wind_gusts_hr = get_hourly_val('wind_gusts_10m',i)
+            wind_gusts_hr = hourly_row.get('wind_gusts_10m')
             if wind_gusts_hr is not None and isinstance(wind_gusts_hr, (int,float)) and wind_gusts_hr > 0:
-                print(f"{indent}{'Wind Gusts:':<{label_width-len(indent)}} {format_value_with_unit(wind_gusts_hr, units.get('wind_gusts_10m', 'km/h'), precision=DEFAULT_PRECISION)}")
+                emit(f"{indent}{'Wind Gusts:':<{label_width-len(indent)}} {format_value_with_unit(wind_gusts_hr, units.get('wind_gusts_10m', 'km/h'), precision=DEFAULT_PRECISION)}")
 
-            print(f"{indent}{'UV Index:':<{label_width-len(indent)}} {format_value_with_unit(get_hourly_val('uv_index',i), units.get('uv_index', ''), precision=DEFAULT_PRECISION)}")
-            
-            pressure_msl_hr = get_hourly_val('pressure_msl',i)
-            print(f"{indent}{'Pressure (MSL):':<{label_width-len(indent)}} {format_value_with_unit(pressure_msl_hr, units.get('pressure_msl', 'hPa'), precision=1)}")
-
-            freezing_level_hr = get_hourly_val('freezing_level_height',i)
-            print(f"{indent}{'Freezing Level:':<{label_width-len(indent)}} {format_value_with_unit(freezing_level_hr, units.get('freezing_level_height', 'm'), precision=0)}")
-            
-            wet_bulb_hr = get_hourly_val('wet_bulb_temperature_2m',i)
-            print(f"{indent}{'Wet Bulb Temp:':<{label_width-len(indent)}} {format_value_with_unit(wet_bulb_hr, units.get('wet_bulb_temperature_2m', '°C'), precision=DEFAULT_PRECISION)}")
+            emit(f"{indent}{'UV Index:':<{label_width-len(indent)}} {uv_labels[position]}")
+            emit(f"{indent}{'Pressure (MSL):':<{label_width-len(indent)}} {pressure_labels[position]}")
+            emit(f"{indent}{'Freezing Level:':<{label_width-len(indent)}} {freezing_level_labels[position]}")
+            emit(f"{indent}{'Wet Bulb Temp:':<{label_width-len(indent)}} {wet_bulb_labels[position]}")
 
-            evapo_hr = get_hourly_val('evapotranspiration',i)
+            evapo_hr = hourly_row.get('evapotranspiration')
             if evapo_hr is not None and isinstance(evapo_hr, (int,float)) and evapo_hr > 0:
-                 print(f"{indent}{'Evapotranspiration:':<{label_width-len(indent)}} {format_value_with_unit(evapo_hr, units.get('evapotranspiration', 'mm'), precision=2)}")
+                 emit(f"{indent}{'Evapotranspiration:':<{label_width-len(indent)}} {format_value_with_unit(evapo_hr, units.get('evapotranspiration', 'mm'), precision=2)}")
 
-            is_day_hr = get_hourly_val('is_day', i)
-            print(f"{indent}{'Day/Night:':<{label_width-len(indent)}} {'Day ☀️' if is_day_hr == 1 else 'Night 🌙' if is_day_hr == 0 else DEFAULT_NA}")
+            is_day_hr = hourly_row.get('is_day')
+            emit(f"{indent}{'Day/Night:':<{label_width-len(indent)}} {'Day ☀️' if is_day_hr == 1 else 'Night 🌙' if is_day_hr == 0 else DEFAULT_NA}")
             
             is_last_iteration = (i == len(hourly_times) - 1)
-            should_break_fallback = (not (current_dt_obj and end_of_today_dt) and displayed_count >= max_display_fallback)
+            should_break_fallback = (current_epoch is None and displayed_count >= max_display_fallback)
             
             if not is_last_iteration and not should_break_fallback:
-                 print(LINE_SEPARATOR_SHORT.center(len(LINE_SEPARATOR_LONG)))
+                 emit(LINE_SEPARATOR_SHORT.center(len(LINE_SEPARATOR_LONG)))
 
         except (IndexError, KeyError) as e:
-            print(f"{indent}[WARN] | Incomplete data for hourly index {i}: {e}")
+            emit(f"{indent}[WARN] | Incomplete data for hourly index {i}: {e}")
         except (ValueError, TypeError) as e:
-            print(f"{indent}[WARN] | Error processing data for hourly index {i} ('{hourly_time_iso}'): {e}")
+            emit(f"{indent}[WARN] | Error processing data for hourly index {i} ('{hourly_time_iso}'): {e}")
         except Exception as e:
-            print(f"{indent}[WARN] | Unexpected error processing hourly index {i}: {e}")
+            emit(f"{indent}[WARN] | Unexpected error processing hourly index {i}: {e}")
 
     if displayed_count == 0:
-        print("No further hourly data available for today.".center(len(LINE_SEPARATOR_LONG)))
+        emit("No further hourly data available for today.".center(len(LINE_SEPARATOR_LONG)))
 
-def display_weather(weather_data, city_display_name):
+def _local_now_iso(forecast):
+    utc_offset = forecast.utc_offset_seconds
+    if utc_offset is None:
+        return None
+    local_now = datetime.now(timezone.utc) + timedelta(seconds=utc_offset)
+    return local_now.strftime("%Y-%m-%dT%H:00")
+
+def _render_lines(render_section, *args):
+    lines = []
+    render_section(lines.append, *args)
+    return "\n".join(lines) + "\n" if lines else ""
+
+def display_current_weather(current_data, units, city_display_name):
+    sys.stdout.write(_render_lines(_render_current_weather, current_data, units, city_display_name))
+
+def display_daily_weather(daily_data, units):
+    sys.stdout.write(_render_lines(_render_daily_weather, daily_data, units))
+
+def display_hourly_weather(hourly_data, units, current_time_iso_str):
+    sys.stdout.write(_render_lines(_render_hourly_weather, hourly_data, units, current_time_iso_str))
+
+def _render_weather(emit, weather_data, city_display_name, sections):
     if not weather_data:
-        print("Weather data couldn't be retrieved or is incomplete.")
+        emit("Weather data couldn't be retrieved or is incomplete.")
         return
 
-    current = weather_data.get('current', {})
-    current_units = weather_data.get('current_units', {})
-    display_current_weather(current, current_units, city_display_name)
+    forecast = parse_forecast(weather_data)
+    current = forecast.current
+    if "current" in sections:
+        _render_current_weather(emit, current, forecast.current_units, city_display_name)
+
+    if "daily" in sections:
+        _render_daily_weather(emit, forecast.daily, forecast.daily.units, forecast.models)
+
+    if "hourly" in sections:
+        if forecast.models:
+            emit(f"\nEnsemble of {len(forecast.models)} models ({', '.join(forecast.models)}): mean [min – max, ±spread]")
+        # Without the current section the payload carries no observation time, so fall back to the location's clock
+        current_time_iso = current.get('time') or _local_now_iso(forecast)
+        _render_hourly_weather(emit, forecast.hourly, forecast.hourly.units, current_time_iso, forecast.models)
+
+def render_text_report(weather_data, city_display_name, sections=DISPLAY_SECTIONS):
+    return _render_lines(_render_weather, weather_data, city_display_name, sections)
+
+def display_weather(weather_data, city_display_name, sections=DISPLAY_SECTIONS):
+    sys.stdout.write(render_text_report(weather_data, city_display_name, sections))
+
+def _json_value(value):
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+def report_record(weather_data, city_display_name, sections=DISPLAY_SECTIONS):
+    """ Plain dict of one location's report, shared by the JSON, NDJSON and CSV outputs """
+    forecast = parse_forecast(weather_data)
+    record = {
+        "location": city_display_name,
+        "latitude": forecast.latitude,
+        "longitude": forecast.longitude,
+        "timezone": forecast.timezone,
+        "utc_offset_seconds": forecast.utc_offset_seconds,
+    }
+    if forecast.models:
+        record["models"] = list(forecast.models)
+    if "current" in sections:
+        record["current"] = {key: _json_value(value) for key, value in forecast.current.items()}
+        record["current_units"] = forecast.current_units
+    if "daily" in sections:
+        record["daily"] = forecast.daily.to_dict()
+        record["daily_units"] = forecast.daily.units
+    if "hourly" in sections:
+        record["hourly"] = forecast.hourly.to_dict()
+        record["hourly_units"] = forecast.hourly.units
+    return record
+
+class ReportRenderer(abc.ABC):
+    """ Turns each location's report into one string; begin/end wrap a whole run of locations """
+    separator = ""
+
+    def __init__(self, sections=DISPLAY_SECTIONS, models=None):
+        self.sections = sections
+        self.models = models
+
+    def begin(self):
+        return ""
+
+    @abc.abstractmethod
+    def render(self, weather_data, city_display_name):
+        """ Returns the output for one location, or "" if it is held back until end() """
+
+    def end(self):
+        return ""
+
+class TextRenderer(ReportRenderer):
+    separator = LINE_SEPARATOR_LONG + "\n"
+
+    def render(self, weather_data, city_display_name):
+        return render_text_report(weather_data, city_display_name, self.sections)
+
+class NdjsonRenderer(ReportRenderer):
+    def render(self, weather_data, city_display_name):
+        record = report_record(weather_data, city_display_name, self.sections)
+        return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+class JsonRenderer(ReportRenderer):
+    """ A single JSON document: an array with one object per location, however many locations there are """
+
+    def __init__(self, sections=DISPLAY_SECTIONS, models=None):
+        super().__init__(sections, models)
+        self._records = []
+
+    def render(self, weather_data, city_display_name):
+        self._records.append(report_record(weather_data, city_display_name, self.sections))
+        return ""
+
+    def end(self):
+        return json.dumps(self._records, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+class CsvRenderer(ReportRenderer):
+    """ One row per current observation, day and hour, with a column per variable across the enabled sections;
+    for an ensemble of models the hourly rows also get the min, max and spread of each averaged variable """
+
+    def __init__(self, sections=DISPLAY_SECTIONS, models=None):
+        super().__init__(sections, models)
+        self.fields = []
+        for section in DISPLAY_SECTIONS:
+            if section in sections:
+                self.fields.extend(field for field in SECTION_FIELDS[section] if field not in self.fields)
+        if "daily" in sections:
+            self.fields.extend(name for name in daily_extra_aggregates if name not in self.fields)
+        if "hourly" in sections and models and len(models) > 1:
+            # Named like the hourly series keys; a name shared with a daily variable shares its column
+            bands = (f"{field}_{statistic}" for field in SECTION_FIELDS["hourly"] if field not in ENSEMBLE_COPIED_VARIABLES
+                     for statistic in ENSEMBLE_STATISTICS)
+            self.fields.extend(name for name in bands if name not in self.fields)
+
+    def _format_rows(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        return buffer.getvalue()
+
+    def begin(self):
+        return self._format_rows([["location", "latitude", "longitude", "section", "time"] + self.fields])
+
+    def render(self, weather_data, city_display_name):
+        forecast = parse_forecast(weather_data)
+        prefix = [city_display_name, forecast.latitude, forecast.longitude]
+        rows = []
+        if "current" in self.sections and forecast.current:
+            current = forecast.current
+            rows.append(prefix + ["current", current.get('time')] + [_json_value(current.get(field)) for field in self.fields])
+        for section in ("daily", "hourly"):
+            if section not in self.sections:
+                continue
+            series = getattr(forecast, section)
+            for row in series:
+                rows.append(prefix + [section, row.time] + [row.get(field) for field in self.fields])
+        return self._format_rows(rows)
+
+OUTPUT_FORMATS = {
+    "text": TextRenderer,
+    "json": JsonRenderer,
+    "ndjson": NdjsonRenderer,
+    "csv": CsvRenderer,
+}
 
-    daily = weather_data.get('daily', {})
-    daily_units = weather_data.get('daily_units', {})
-    display_daily_weather(daily, daily_units)
+def get_renderer(output_format="text", sections=DISPLAY_SECTIONS, models=None):
+    try:
+        return OUTPUT_FORMATS[output_format](sections, models)
+    except KeyError:
+        raise ValueError(f"unknown output format {output_format!r}, expected one of {', '.join(OUTPUT_FORMATS)}")
+
+
+def iter_batch_reports(city_names, api_key, geocode_concurrency=BATCH_GEOCODE_CONCURRENCY,
+                       weather_concurrency=BATCH_WEATHER_CONCURRENCY, use_cache=True, sections=DISPLAY_SECTIONS, plan_stats=None,
+                       models=None):
+    """ Yields (city, resolved_name, weather_data, error) tuples in completion order. Cities are geocoded as the
+    input is read, and forecasts are fetched while geocoding goes on: the model grid cells of located cities are
+    sent in multi-location requests (one request per cell for an ensemble), and cities sharing a cell that is
+    already being fetched wait for it. A request with fewer than WEATHER_BATCH_MAX_LOCATIONS cells only goes out
+    when no other one is in flight or geocoding is over, so slow geocoding still streams reports and fast
+    geocoding fills the requests. plan_stats, when given, receives the number of located cities and distinct cells. """
+    import queue
+    from concurrent.futures import ThreadPoolExecutor
+
+    ensemble = bool(models) and len(models) > 1
+    model = models[0] if models and not ensemble else None
+    chunk_size = 1 if ensemble else WEATHER_BATCH_MAX_LOCATIONS
+    resolution = model_grid_resolution(",".join(models or ()))
+    events = queue.Queue()
+    stopped = threading.Event()
+    geocode_executor = ThreadPoolExecutor(max_workers=geocode_concurrency)
+    weather_executor = ThreadPoolExecutor(max_workers=weather_concurrency)
+
+    def locate(city_name):
+        if stopped.is_set():
+            return
+        try:
+            coordinates_tuple, resolved_city_name = get_coordinates(city_name, api_key, use_cache)
+        except Exception as e:
+            events.put(("failed", (city_name, city_name, f"unexpected error: {e}")))
+            return
+        if coordinates_tuple:
+            events.put(("located", (city_name, resolved_city_name, coordinates_tuple)))
+        else:
+            events.put(("failed", (city_name, resolved_city_name, "could not obtain coordinates")))
 
-    hourly = weather_data.get('hourly', {})
-    hourly_units = weather_data.get('hourly_units', {})
-    current_time_iso = current.get('time') 
-    display_hourly_weather(hourly, hourly_units, current_time_iso)
+    def read_input():
+        try:
+            for city_name in city_names:
+                city_name = city_name.strip()
+                if stopped.is_set():
+                    return
+                if city_name and not city_name.startswith("#"):
+                    geocode_executor.submit(locate, city_name)
+            geocode_executor.shutdown(wait=True)
+            events.put(("geocoded", None))
+        except Exception as e:
+            events.put(("input_error", e))
 
+    def fetch(chunk):
+        fetched = set()
+        try:
+            if stopped.is_set():
+                return
+            if ensemble:
+                results = ((i, get_forecast(lat, lon, use_cache, sections, models)) for i, (_, (lat, lon)) in enumerate(chunk))
+            else:
+                results = iter_weather_data_many([coordinates for _, coordinates in chunk], use_cache, sections, model)
+            for i, weather_data in results:
+                fetched.add(i)
+                events.put(("fetched", (chunk[i][0], weather_data, None if weather_data else "could not retrieve weather data")))
+        except Exception as e:
+            for i, (cell, _) in enumerate(chunk):
+                if i not in fetched:
+                    events.put(("fetched", (cell, None, f"unexpected error: {e}")))
+        finally:
+            events.put(("chunk_done", None))
+
+    # Grid cell -> (coordinates fetched for it, cities waiting for it). Cells are forgotten once fetched, so no
+    # payload outlives its report; a city located later in a fetched cell gets it again, from the forecast cache.
+    waiting = {}
+    pending, in_flight, geocoding = [], 0, True
+    located, distinct_cells = 0, set()
+    threading.Thread(target=read_input, daemon=True).start()
+    try:
+        while geocoding or pending or in_flight:
+            while pending and in_flight < weather_concurrency and (len(pending) >= chunk_size or not in_flight or not geocoding):
+                chunk, pending = pending[:chunk_size], pending[chunk_size:]
+                weather_executor.submit(fetch, [(cell, waiting[cell][0]) for cell in chunk])
+                in_flight += 1
+            received = [events.get()]
+            while True:
+                try:
+                    received.append(events.get_nowait())
+                except queue.Empty:
+                    break
+            for kind, event in received:
+                if kind == "located":
+                    city_name, resolved_city_name, (lat, lon) = event
+                    located += 1
+                    cell = snap_to_grid(float(lat), float(lon), resolution)
+                    distinct_cells.add(cell)
+                    if cell not in waiting:
+                        waiting[cell] = ((float(lat), float(lon)), [])
+                        pending.append(cell)
+                    waiting[cell][1].append((city_name, resolved_city_name))
+                elif kind == "fetched":
+                    cell, weather_data, error = event
+                    for city_name, resolved_city_name in waiting.pop(cell)[1]:
+                        yield city_name, resolved_city_name, weather_data, error
+                elif kind == "failed":
+                    city_name, resolved_city_name, error = event
+                    yield city_name, resolved_city_name, None, error
+                elif kind == "chunk_done":
+                    in_flight -= 1
+                elif kind == "geocoded":
+                    geocoding = False
+                else:
+                    raise event
+    finally:
+        stopped.set()
+        geocode_executor.shutdown(wait=False)
+        weather_executor.shutdown(wait=False)
+    if plan_stats is not None:
+        plan_stats.update(locations=located, cells=len(distinct_cells))
+
+def run_batch(city_names, api_key, geocode_concurrency=BATCH_GEOCODE_CONCURRENCY,
+              weather_concurrency=BATCH_WEATHER_CONCURRENCY, use_cache=True, sections=DISPLAY_SECTIONS,
+              renderer=None, out=None, models=None):
+    renderer = renderer or TextRenderer(sections)
+    out = out or sys.stdout
+    out.write(renderer.begin())
+    succeeded, failed, plan_stats = 0, [], {}
+    try:
+        for city_name, resolved_city_name, weather_data, error in iter_batch_reports(
+                city_names, api_key, geocode_concurrency, weather_concurrency, use_cache, sections, plan_stats, models):
+            if error:
+                failed.append(city_name)
+                print(f"[ERROR] | {city_name}: {error}")
+                continue
+            out.write(renderer.render(weather_data, resolved_city_name) + renderer.separator)
+            out.flush()
+            succeeded += 1
+    finally:
+        geocode_cache.save()
+    out.write(renderer.end())
+    print(f"\nBatch finished: {succeeded} succeeded, {len(failed)} failed.")
+    if plan_stats.get("cells", 0) < plan_stats.get("locations", 0):
+        print(f"{plan_stats['locations']} located cities shared {plan_stats['cells']} forecast grid cells.")
+    for city_name in failed:
+        print(f"  [FAILED] | {city_name}")
+    return succeeded, failed
+
+def _same_value(old_value, new_value):
+    return old_value == new_value or (old_value != old_value and new_value != new_value)
+
+def _diff_series(section, old_series, new_series, changes):
+    old_positions = {t: i for i, t in enumerate(old_series.times)}
+    n = len(new_series)
+    # Refreshes usually keep (or just shift) the time axis, so compare the overlapping block in one go first
+    start = old_positions.get(new_series.times[0]) if n else None
+    overlap = 0
+    if start is not None:
+        old_times = old_series.times[start:start + n]
+        if old_times == new_series.times[:len(old_times)]:
+            overlap = len(old_times)
+
+    for key in new_series.keys():
+        old_column, new_column = old_series.column(key), new_series.column(key)
+        first = 0
+        if overlap and old_column is not None and old_column[start:start + overlap] == new_column[:overlap]:
+            first = overlap
+        for j in range(first, n):
+            time_label = new_series.times[j]
+            i = old_positions.get(time_label)
+            old_value = old_series.value(key, i) if i is not None else None
+            new_value = new_series.value(key, j)
+            if not _same_value(old_value, new_value):
+                changes.append((section, time_label, key, old_value, new_value))
+
+def diff_forecasts(old_weather_data, new_weather_data, sections=DISPLAY_SECTIONS):
+    """ (section, time, field, old, new) for every value that differs; time is None for current conditions """
+    old_forecast, new_forecast = parse_forecast(old_weather_data), parse_forecast(new_weather_data)
+    changes = []
+    if "current" in sections:
+        for key, new_value in new_forecast.current.items():
+            if key in ("time", "interval"):
+                continue
+            old_value = old_forecast.current.get(key)
+            if not _same_value(old_value, new_value):
+                changes.append(("current", None, key, old_value, new_value))
+        if old_forecast.current.get("time") != new_forecast.current.get("time"):
+            changes.insert(0, ("current", None, "time", old_forecast.current.get("time"), new_forecast.current.get("time")))
+    for section in ("daily", "hourly"):
+        if section in sections:
+            _diff_series(section, getattr(old_forecast, section), getattr(new_forecast, section), changes)
+    return changes
+
+def format_changes_text(city_display_name, changes, weather_data):
+    forecast = parse_forecast(weather_data)
+    units = {"current": forecast.current_units, "daily": forecast.daily.units, "hourly": forecast.hourly.units}
+    lines = [f"[{datetime.now().strftime(TIME_ONLY_FORMAT)}] {city_display_name}: {len(changes)} change(s)"]
+    for section, time_label, key, old_value, new_value in changes:
+        unit = units[section].get(key, '') if key != "time" else ''
+        where = f"{section}" if time_label is None else f"{section} {time_label}"
+        lines.append(f"  {where} {key}: {format_value_with_unit(old_value, unit)} → {format_value_with_unit(new_value, unit)}")
+    return "\n".join(lines) + "\n"
+
+def _watch_emit(out, output_format, city_display_name, weather_data, sections, changes=None):
+    if output_format == "ndjson":
+        if changes is None:
+            event = {"event": "snapshot", **report_record(weather_data, city_display_name, sections)}
+        else:
+            event = {"event": "changes", "location": city_display_name,
+                     "changes": [{"section": section, "time": time_label, "field": key, "old": _json_value(old_value), "new": _json_value(new_value)}
+                                 for section, time_label, key, old_value, new_value in changes]}
+        out.write(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n")
+    elif changes is None:
+        out.write(render_text_report(weather_data, city_display_name, sections) + LINE_SEPARATOR_LONG + "\n")
+    else:
+        out.write(format_changes_text(city_display_name, changes, weather_data))
+    out.flush()
+
+def watch_locations(locations, sections=DISPLAY_SECTIONS, output_format="text", out=None, use_cache=True,
+                    min_interval=WATCH_MIN_INTERVAL_SECONDS, max_cycles=None, model=None):
+    """ Keeps (display_name, lat, lon) locations fresh: each one is refetched only once its forecast expires,
+    and after the first full report only the changed values are emitted """
+    out = out or sys.stdout
+    watched = [{"name": name, "lat": lat, "lon": lon, "weather_data": None, "due": 0.0} for name, lat, lon in locations]
+    cycles = 0
+    while watched and (max_cycles is None or cycles < max_cycles):
+        cycles += 1
+        now = time.time()
+        for location in watched:
+            if now < location["due"]:
+                continue
+            previous = location["weather_data"]
+            key = forecast_cache_key(build_weather_params(location["lat"], location["lon"], sections, model)) if use_cache else None
+            if previous is None:
+                weather_data = get_weather_data(location["lat"], location["lon"], use_cache=use_cache, sections=sections, model=model)
+            else:
+                weather_data = None
+                if use_cache:
+                    # A fresh entry means another watched location in the same grid cell has just refreshed it
+                    cached, is_stale = forecast_cache.lookup(key)
+                    weather_data = None if is_stale else cached
+                if weather_data is None:
+                    weather_data = refresh_weather_data(location["lat"], location["lon"], use_cache=use_cache, sections=sections, model=model)
+            if not weather_data:
+                print(f"[ERROR] | {location['name']}: could not retrieve weather data, retrying in {min_interval:.0f}s")
+                location["due"] = now + min_interval
+                continue
+
+            if previous is None:
+                _watch_emit(out, output_format, location["name"], weather_data, sections)
+            else:
+                changes = diff_forecasts(previous, weather_data, sections)
+                if changes:
+                    _watch_emit(out, output_format, location["name"], weather_data, sections, changes)
+            location["weather_data"] = weather_data
+            cached_expiry = forecast_cache.expires_at(key) if use_cache else None
+            location["due"] = max(cached_expiry or forecast_expiry(weather_data), now + min_interval)
+
+        if max_cycles is not None and cycles >= max_cycles:
+            break
+        next_due = min(location["due"] for location in watched)
+        time.sleep(min(max(next_due - time.time(), 1.0), WATCH_MAX_SLEEP_SECONDS))
+    return cycles
+
+SERVICE_DEFAULT_HOST = "127.0.0.1"
+SERVICE_DEFAULT_PORT = 8080
+
+@functools.lru_cache(maxsize=None)
+def _request_handler_class():
+    """ Defines the service's request handler on first use, so http.server is only imported when serving """
+    from http.server import BaseHTTPRequestHandler
+
+    class WeatherRequestHandler(BaseHTTPRequestHandler):
+        """ GET /weather?city=... or /weather?lat=..&lon=.. [&name=..][&format=json|text][&sections=..], plus /stats and /health """
+        protocol_version = "HTTP/1.1"
+        server_version = "WeatherReporter"
+
+        def log_message(self, format, *args):
+            if self.server.access_log:
+                super().log_message(format, *args)
+
+        def _send(self, status, body, content_type="application/json; charset=utf-8"):
+            payload = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _send_json(self, status, document):
+            self._send(status, json.dumps(document, ensure_ascii=False, separators=(",", ":")))
+
+        def _send_error(self, status, message):
+            self._send_json(status, {"error": message})
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            if url.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            elif url.path == "/stats":
+                self._send_json(200, service_stats())
+            elif url.path == "/weather":
+                try:
+                    status, body, content_type = handle_weather_query(query, self.server.api_key, self.server.sections,
+                                                                       self.server.models)
+                except Exception as e:
+                    self._send_error(500, f"unexpected error: {e}")
+                    return
+                self._send(status, body, content_type)
+            else:
+                self._send_error(404, f"unknown path {url.path!r}")
+
+    return WeatherRequestHandler
+
+def __getattr__(name):
+    if name == "WeatherRequestHandler":
+        return _request_handler_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def service_stats():
+    return {
+        "geocode_cache": geocode_cache.stats(),
+        "forecast_cache": forecast_cache.stats(),
+        "coalesced": {"geocoding": geocode_flights.coalesced, "forecast": forecast_flights.coalesced},
+        "upstreams": {stage: scheduler.stats() for stage, scheduler in upstream_schedulers.items()},
+        **({"profile": _profiler.summary()} if _profiler is not None else {}),
+    }
 
-if __name__ == "__main__":
-    OPENWEATHERMAP_API_KEY = os.getenv('OPENWEATHERMAP_API_KEY')
-    if not OPENWEATHERMAP_API_KEY:
-        print("[ERROR] | OPENWEATHERMAP_API_KEY not found in environment variables. Please set it in .env file.")
-        exit()
-        
-    city_input = input("Enter city name: ").strip()
-    if not city_input:
-        print("[ERROR] | City name cannot be empty.")
+def handle_weather_query(query, api_key, default_sections=DISPLAY_SECTIONS, default_models=None):
+    """ Returns (status, body, content_type) for one /weather query """
+    json_type = "application/json; charset=utf-8"
+    def error(status, message):
+        return status, json.dumps({"error": message}, separators=(",", ":")), json_type
+
+    output_format = query.get("format", "json")
+    if output_format not in ("json", "text"):
+        return error(400, "format must be 'json' or 'text'")
+    try:
+        sections = parse_sections(query["sections"]) if "sections" in query else default_sections
+    except ValueError as e:
+        return error(400, str(e))
+    models = parse_models(query["models"]) if "models" in query else default_models
+
+    if "lat" in query or "lon" in query:
+        try:
+            latitude, longitude = float(query["lat"]), float(query["lon"])
+        except (KeyError, ValueError):
+            return error(400, "lat and lon must both be numbers")
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return error(400, "lat/lon out of range")
+        display_name = query.get("name") or f"{latitude:.4f}, {longitude:.4f}"
+    elif query.get("city", "").strip():
+        if not api_key and not city_index.available():
+            return error(503, "city lookups need OPENWEATHERMAP_API_KEY or the offline city index")
+        coordinates_tuple, display_name = get_coordinates(query["city"].strip(), api_key)
+        if not coordinates_tuple:
+            return error(404, f"could not obtain coordinates for {query['city']!r}")
+        latitude, longitude = coordinates_tuple
     else:
-        print(f"Searching for coordinates for '{city_input}'...")
-        coordinates_tuple, resolved_city_name = get_coordinates(city_input, OPENWEATHERMAP_API_KEY)
+        return error(400, "pass either city or lat and lon")
+
+    weather_data = get_forecast(latitude, longitude, sections=sections, models=models)
+    if not weather_data:
+        return error(502, "could not retrieve weather data")
+    if output_format == "text":
+        return 200, render_text_report(weather_data, display_name, sections), "text/plain; charset=utf-8"
+    return 200, json.dumps(report_record(weather_data, display_name, sections), ensure_ascii=False, separators=(",", ":")), json_type
+
+def create_service(host=SERVICE_DEFAULT_HOST, port=SERVICE_DEFAULT_PORT, api_key=None,
+                   sections=DISPLAY_SECTIONS, access_log=False, models=None):
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((host, port), _request_handler_class())
+    server.daemon_threads = True
+    server.api_key = api_key
+    server.sections = sections
+    server.models = models
+    server.access_log = access_log
+    return server
+
+def serve(host=SERVICE_DEFAULT_HOST, port=SERVICE_DEFAULT_PORT, api_key=None, sections=DISPLAY_SECTIONS, access_log=False,
+          models=None):
+    server = create_service(host, port, api_key, sections, access_log, models)
+    print(f"Serving weather reports on http://{server.server_address[0]}:{server.server_address[1]}/weather (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+    finally:
+        server.server_close()
+        geocode_cache.save()
+
+PROFILED_STAGES = (
+    # (stage, module-level function, label by the upstream stage passed as first argument)
+    ("geocode", "get_coordinates", False),
+    ("forecast", "get_weather_data", False),
+    ("forecast_many", "iter_weather_data_many", False),
+    ("ensemble", "get_ensemble_data", False),
+    ("http", "http_get", True),
+    ("download", "iter_response_chunks", True),
+    ("decode", "decode_json", True),
+    ("decode", "decode_json_stream", True),
+    ("parse", "parse_forecast", False),
+    ("render_current", "_render_current_weather", False),
+    ("render_daily", "_render_daily_weather", False),
+    ("render_hourly", "_render_hourly_weather", False),
+    ("render_record", "report_record", False),
+)
+
+class StageProfiler:
+    """ Per-stage call counts and wall-clock times, optionally keeping every call as a metrics event """
+
+    def __init__(self, keep_events=False):
+        self.started = time.perf_counter()
+        self.keep_events = keep_events
+        self.events = []
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, started, elapsed):
+        with self._lock:
+            totals = self._totals.get(stage)
+            if totals is None:
+                totals = self._totals[stage] = [0, 0.0, 0.0]
+            totals[0] += 1
+            totals[1] += elapsed
+            totals[2] = max(totals[2], elapsed)
+            if self.keep_events:
+                self.events.append({"event": "stage", "stage": stage, "start_ms": round((started - self.started) * 1000, 3),
+                                    "duration_ms": round(elapsed * 1000, 3), "thread": threading.current_thread().name})
+
+    def timed(self, stage, fn, label_by_upstream=False):
+        import inspect
+
+        if inspect.isgeneratorfunction(fn):
+            return self._timed_generator(stage, fn, label_by_upstream)
+
+        @functools.wraps(fn)
+        def timed_call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(f"{stage}.{args[0]}" if label_by_upstream else stage, started, time.perf_counter() - started)
+        return timed_call
+
+    def _timed_generator(self, stage, fn, label_by_upstream):
+        """ Times a generator as one call: the time spent producing its values, not the time its consumer
+        spends between them, recorded when it is exhausted or closed """
+        @functools.wraps(fn)
+        def timed_generator(*args, **kwargs):
+            generator = fn(*args, **kwargs)
+            started, elapsed = time.perf_counter(), 0.0
+            try:
+                while True:
+                    resumed = time.perf_counter()
+                    try:
+                        value = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - resumed
+                    yield value
+            finally:
+                generator.close()
+                self.record(f"{stage}.{args[0]}" if label_by_upstream else stage, started, elapsed)
+        return timed_generator
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def summary(self):
+        with self._lock:
+            return {stage: {"count": count, "total_ms": total * 1000, "mean_ms": total / count * 1000, "max_ms": longest * 1000}
+                    for stage, (count, total, longest) in self._totals.items()}
+
+_profiler = None
+_unprofiled_functions = {}
+
+def enable_profiling(keep_events=False):
+    """ Swaps the profiled functions for timed wrappers; until then the hooks do not exist and cost nothing """
+    global _profiler
+    if _profiler is not None:
+        return _profiler
+    _profiler = StageProfiler(keep_events)
+    module_globals = globals()
+    for stage, name, label_by_upstream in PROFILED_STAGES:
+        _unprofiled_functions[name] = module_globals[name]
+        module_globals[name] = _profiler.timed(stage, module_globals[name], label_by_upstream)
+    return _profiler
+
+def disable_profiling():
+    global _profiler
+    globals().update(_unprofiled_functions)
+    _unprofiled_functions.clear()
+    profiler, _profiler = _profiler, None
+    return profiler
+
+def _ordered_stage_summary(profiler):
+    summary = profiler.summary()
+    order = {stage: position for position, (stage, _, _) in enumerate(PROFILED_STAGES)}
+    return sorted(summary.items(), key=lambda item: (order.get(item[0].split(".")[0], len(order)), item[0]))
+
+def format_profile(profiler):
+    lines = ["Profile (wall-clock ms; a stage includes the stages it calls):",
+             f"  {'stage':<20} {'calls':>7} {'total':>10} {'mean':>10} {'max':>10}"]
+    for stage, stats in _ordered_stage_summary(profiler):
+        lines.append(f"  {stage:<20} {stats['count']:>7} {stats['total_ms']:>10.1f} {stats['mean_ms']:>10.2f} {stats['max_ms']:>10.1f}")
+    lines.append(f"  {'elapsed':<20} {'':>7} {profiler.elapsed_ms():>10.1f}")
+    lines.append(f"  Coalesced upstream calls: geocoding={geocode_flights.coalesced} forecast={forecast_flights.coalesced}")
+    return "\n".join(lines)
+
+def write_profile_metrics(profiler, path):
+    """ Writes every timed call, then per-stage totals and cache counters, as JSON lines """
+    records = list(profiler.events)
+    records.extend({"event": "summary", "stage": stage, **stats} for stage, stats in _ordered_stage_summary(profiler))
+    records.append({"event": "cache", "cache": "geocoding", **geocode_cache.stats()})
+    records.append({"event": "cache", "cache": "forecast", **forecast_cache.stats()})
+    records.append({"event": "total", "elapsed_ms": profiler.elapsed_ms(),
+                    "coalesced": {"geocoding": geocode_flights.coalesced, "forecast": forecast_flights.coalesced}})
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+def _sections_arg(sections_text):
+    try:
+        return parse_sections(sections_text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def _daily_aggregates_arg(names_text):
+    names = tuple(name.strip() for name in names_text.split(",") if name.strip())
+    try:
+        aggregate_sources(names)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return names
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Current, daily and hourly weather report for a city.")
+    parser.add_argument("city", nargs="?", help="City name (prompted for when omitted)")
+    parser.add_argument("--batch", metavar="FILE", help="Report on every city in a file with one city per line ('-' for stdin)")
+    parser.add_argument("--geocode-concurrency", type=int, default=BATCH_GEOCODE_CONCURRENCY, help="Concurrent geocoding lookups in batch mode")
+    parser.add_argument("--weather-concurrency", type=int, default=BATCH_WEATHER_CONCURRENCY, help="Concurrent forecast requests in batch mode")
+    parser.add_argument("--sections", type=_sections_arg, default=DISPLAY_SECTIONS,
+                        help=f"Comma-separated report sections to fetch and show (default: {','.join(DISPLAY_SECTIONS)})")
+    parser.add_argument("--current-only", dest="sections", action="store_const", const=("current",),
+                        help="Only fetch and show current conditions")
+    parser.add_argument("--models", type=parse_models, metavar="LIST",
+                        help=f"Comma-separated Open-Meteo models; several are fetched in parallel and shown as an ensemble (default: {FORECAST_MODEL})")
+    parser.add_argument("--ensemble", dest="models", action="store_const", const=ENSEMBLE_MODELS,
+                        help=f"Same as --models {','.join(ENSEMBLE_MODELS)}")
+    parser.add_argument("--format", dest="output_format", choices=tuple(OUTPUT_FORMATS), default="text",
+                        help="Report format; with json, ndjson or csv all status messages go to stderr")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep the city (or --batch list) up to date, refetching as forecasts expire and printing only what changed")
+    parser.add_argument("--watch-interval", type=float, default=WATCH_MIN_INTERVAL_SECONDS,
+                        help=f"Minimum seconds between refreshes of one location in --watch mode (default: {WATCH_MIN_INTERVAL_SECONDS})")
+    parser.add_argument("--serve", action="store_true", help="Run a local HTTP service answering /weather?city= and /weather?lat=&lon=")
+    parser.add_argument("--host", default=SERVICE_DEFAULT_HOST, help=f"Service bind address (default: {SERVICE_DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=SERVICE_DEFAULT_PORT, help=f"Service port (default: {SERVICE_DEFAULT_PORT})")
+    parser.add_argument("--access-log", action="store_true", help="Log every service request to stderr")
+    parser.add_argument("--city-index", metavar="FILE",
+                        help=f"Offline city index to geocode with (default: {CITY_INDEX_FILENAME} in the cache directory, used when present)")
+    parser.add_argument("--build-city-index", metavar="CITIES_FILE",
+                        help="Build the offline city index from a GeoNames cities dump (e.g. cities15000.txt) and exit")
+    parser.add_argument("--admin1-codes", metavar="FILE", help="GeoNames admin1CodesASCII.txt, adds region names when building the city index")
+    parser.add_argument("--index-alternate-names", action="store_true", help="Also index the GeoNames alternate names (larger index)")
+    parser.add_argument("--prewarm", metavar="FILE", help="Pre-warm the geocoding cache from a file with one city per line ('-' for stdin)")
+    parser.add_argument("--geocode-timeout", type=float, help=f"Geocoding read timeout in seconds (default: {STAGE_TIMEOUTS[GEOCODING_STAGE][1]})")
+    parser.add_argument("--forecast-timeout", type=float, help=f"Forecast read timeout in seconds (default: {STAGE_TIMEOUTS[FORECAST_STAGE][1]})")
+    parser.add_argument("--retries", type=int, default=HTTP_MAX_RETRIES, help="Retries for connection errors, 429 and 5xx responses")
+    parser.add_argument("--rate-limit", metavar="STAGE=RATE[/BURST]", action="append", default=[],
+                        help="Requests per second (and burst) allowed to the geocoding or forecast upstream, or 'off' "
+                             f"(defaults: {', '.join(f'{stage}={rate:g}/{burst}' for stage, (rate, burst) in UPSTREAM_RATE_LIMITS.items())})")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the geocoding and forecast caches")
+    parser.add_argument("--forecast-disk-cache", action="store_true", help="Also keep fetched forecasts on disk so they survive restarts")
+    parser.add_argument("--cache-stats", action="store_true", help="Print cache hit/miss counts before exiting")
+    parser.add_argument("--archive", action="store_true", help="Append every fetched forecast to the local forecast archive")
+    parser.add_argument("--archive-file", metavar="FILE",
+                        help=f"Forecast archive location (default: {FORECAST_ARCHIVE_FILENAME} in the cache directory; implies --archive)")
+    parser.add_argument("--history", metavar="DATE",
+                        help="Show how the archived forecast for the city on DATE (YYYY-MM-DD) or hour (YYYY-MM-DDTHH:00) changed across runs")
+    parser.add_argument("--observed", metavar="DAYS", type=float,
+                        help="Show the current conditions archived for the city over the last DAYS days")
+    parser.add_argument("--daily-aggregates", metavar="LIST", type=_daily_aggregates_arg,
+                        help="Extra daily values computed from the hourly series, as comma-separated <variable>_<min|max|mean|sum> "
+                             "(e.g. heat_index_max,wind_chill_min,pressure_msl_mean)")
+    parser.add_argument("--profile", action="store_true", help="Print a per-stage timing breakdown and cache counters before exiting")
+    parser.add_argument("--profile-metrics", metavar="FILE", help="Write every timed stage call and the totals to FILE as JSON lines (implies --profile)")
+    return parser
+
+def _open_city_list(path):
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin)
+    return open(path, "r", encoding="utf-8")
+
+def _print_cache_stats():
+    print(f"\nGeocoding cache: {format_cache_stats(geocode_cache.stats())}")
+    print(f"Forecast cache: {format_cache_stats(forecast_cache.stats())}")
+    if city_index.available():
+        print("City index: " + " ".join(f"{name}={value}" for name, value in city_index.stats().items()))
+    for stage, scheduler in upstream_schedulers.items():
+        stats = scheduler.stats()
+        if stats["requests"]:
+            print(f"Upstream {stage}: requests={stats['requests']} rate_limited={stats['rate_limited']} "
+                  f"waited={stats['waited_seconds']:.2f}s concurrency={stats['concurrency']}/{stats['max_concurrency']}")
+
+def _print_diagnostics(args):
+    if args.cache_stats or _profiler is not None:
+        _print_cache_stats()
+    if _profiler is None:
+        return
+    print(format_profile(_profiler))
+    if args.profile_metrics:
+        try:
+            write_profile_metrics(_profiler, args.profile_metrics)
+        except OSError as e:
+            print(f"[ERROR] | Could not write profile metrics '{args.profile_metrics}': {e}")
+
+def report_city(city_input, api_key, use_cache=True, sections=DISPLAY_SECTIONS, renderer=None, out=None, models=None):
+    """ Writes one city's report; on failure the renderer's empty document (e.g. "[]" or the CSV header) is
+    written instead. Returns whether the report could be made. """
+    renderer = renderer or TextRenderer(sections)
+    out = out or sys.stdout
+    print(f"Searching for coordinates for '{city_input}'...")
+    coordinates_tuple, resolved_city_name = get_coordinates(city_input, api_key, use_cache=use_cache)
+    geocode_cache.save()
+    
+    if coordinates_tuple:
+        latitude, longitude = coordinates_tuple
+        print(f"\nFetching weather data for {resolved_city_name} (Lat: {latitude:.2f}, Lon: {longitude:.2f})...")
         
-        if coordinates_tuple:
-            latitude, longitude = coordinates_tuple
-            print(f"\nFetching weather data for {resolved_city_name} (Lat: {latitude:.2f}, Lon: {longitude:.2f})...")
-            
-            weather_data = get_weather_data(latitude, longitude)
-            if weather_data:
-                display_weather(weather_data, resolved_city_name)
+        weather_data = get_forecast(latitude, longitude, use_cache=use_cache, sections=sections, models=models)
+        if weather_data:
+            out.write(renderer.begin() + renderer.render(weather_data, resolved_city_name) + renderer.end())
+            return True
+        print("Failed to retrieve detailed weather data.")
+    else:
+        print(f"Failed to obtain coordinates for '{city_input}'. Cannot fetch weather data.")
+    out.write(renderer.begin() + renderer.end())
+    return False
+
+@contextlib.contextmanager
+def _report_output(output_format):
+    """ Yields the stream reports go to; machine-readable formats move every other message to stderr """
+    out = sys.stdout
+    if output_format == "text":
+        yield out
+        return
+    with contextlib.redirect_stdout(sys.stderr):
+        yield out
+
+def _run_watch(args, api_key):
+    if args.output_format not in WATCH_OUTPUT_FORMATS:
+        print(f"[ERROR] | --watch supports --format {' or '.join(WATCH_OUTPUT_FORMATS)} only.")
+        return 1
+    if args.batch:
+        try:
+            with _open_city_list(args.batch) as city_lines:
+                city_names = [line.strip() for line in city_lines if line.strip() and not line.strip().startswith("#")]
+        except OSError as e:
+            print(f"[ERROR] | Could not read city list '{args.batch}': {e}")
+            return 1
+    else:
+        city_names = [(args.city or input("Enter city name: ")).strip()]
+
+    locations = []
+    with _report_output(args.output_format) as out:
+        for city_name in city_names:
+            if not city_name:
+                continue
+            coordinates_tuple, resolved_city_name = get_coordinates(city_name, api_key, use_cache=not args.no_cache)
+            if coordinates_tuple:
+                locations.append((resolved_city_name, coordinates_tuple[0], coordinates_tuple[1]))
             else:
-                print("Failed to retrieve detailed weather data.")
-        else:
-            print(f"Failed to obtain coordinates for '{city_input}'. Cannot fetch weather data.")
\ No newline at end of file
+                print(f"[ERROR] | {city_name}: could not obtain coordinates, not watching it")
+        geocode_cache.save()
+        if not locations:
+            print("[ERROR] | No locations to watch.")
+            return 1
+        try:
+            watch_locations(locations, args.sections, args.output_format, out, use_cache=not args.no_cache,
+                            min_interval=max(1.0, args.watch_interval), model=args.models[0] if args.models else None)
+        except KeyboardInterrupt:
+            print("\nStopped watching.")
+    return 0
+
+def format_archive_table(title, headers, table):
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *table)]
+    lines = [title, LINE_SEPARATOR_LONG,
+             "  ".join(header.ljust(width) for header, width in zip(headers, widths)).rstrip()]
+    lines.extend("  ".join(str(cell).ljust(width) for cell, width in zip(row, widths)).rstrip() for row in table)
+    return "\n".join(lines)
+
+def _format_issue_time(issued_at, utc_offset_seconds):
+    return datetime.fromtimestamp(issued_at + (utc_offset_seconds or 0), timezone.utc).strftime(ARCHIVE_TIME_FORMAT)
+
+def _run_archive_query(args, api_key):
+    if args.output_format not in ("text", "json"):
+        print("[ERROR] | --history and --observed support --format text or json only.")
+        return 1
+    archive = ForecastArchive(args.archive_file)
+    if not os.path.exists(archive._get_path()):
+        print(f"[ERROR] | No forecast archive at '{archive._get_path()}'. Fetch forecasts with --archive first.")
+        return 1
+    city_input = (args.city or input("Enter city name: ")).strip()
+    coordinates_tuple, resolved_city_name = get_coordinates(city_input, api_key, use_cache=not args.no_cache)
+    geocode_cache.save()
+    if not coordinates_tuple:
+        print(f"[ERROR] | Failed to obtain coordinates for '{city_input}'.")
+        return 1
+
+    latitude, longitude = coordinates_tuple
+    # Runs of the models asked for with --models (the default model otherwise); several get a Model column
+    models = args.models or None
+    model_label = (lambda row: [row["model"]]) if models and len(models) > 1 else (lambda row: [])
+    model_header = ["Model"] if models and len(models) > 1 else []
+    runs = archive.runs(latitude, longitude, model=models)
+    utc_offset = runs[-1]["utc_offset_seconds"] if runs else 0
+    if args.history:
+        section = "hourly" if "T" in args.history else "daily"
+        variables = HISTORY_HOURLY_VARIABLES if section == "hourly" else HISTORY_DAILY_VARIABLES
+        rows = archive.forecast_history(latitude, longitude, args.history, section, variables, model=models)
+        title = f"Forecast history for {resolved_city_name} on {args.history} ({len({(row['issued_at'], row['model']) for row in rows})} runs)"
+        headers = ["Issued"] + model_header + ["Time"] + list(variables)
+        format_time = (lambda t: format_timestamp(t, ARCHIVE_TIME_FORMAT)) if section == "hourly" else format_daily_date
+        labels = lambda row: [_format_issue_time(row["issued_at"], utc_offset)] + model_label(row) + [format_time(row["time"])]
+    else:
+        section, variables = "current", OBSERVED_VARIABLES
+        rows = archive.observed(latitude, longitude, args.observed, variables, model=models)
+        title = f"Observed conditions for {resolved_city_name} over the last {args.observed:g} days ({len(rows)} observations)"
+        headers = ["Observed"] + model_header + list(variables)
+        labels = lambda row: [format_timestamp(row["time"], ARCHIVE_TIME_FORMAT)] + model_label(row)
+
+    if args.output_format == "json":
+        print(json.dumps({"location": resolved_city_name, "latitude": latitude, "longitude": longitude,
+                          "section": section, "rows": rows}, ensure_ascii=False))
+        return 0
+    if not rows:
+        print(f"{title}\nNothing archived yet.")
+        return 0
+    units = runs[-1]["units"].get(section, {})
+    table = [labels(row) + [format_value_with_unit(row[name], units.get(name, "")) for name in variables] for row in rows]
+    print(format_archive_table(title, headers, table))
+    return 0
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    forecast_cache.persist = args.forecast_disk_cache
+    timeouts = {stage: timeout for stage, timeout in ((GEOCODING_STAGE, args.geocode_timeout), (FORECAST_STAGE, args.forecast_timeout))
+                if timeout is not None}
+    configure_http(pool_size=max(HTTP_POOL_SIZE, args.geocode_concurrency + args.weather_concurrency),
+                   max_retries=max(0, args.retries), timeouts=timeouts)
+    try:
+        configure_rate_limits(dict(parse_rate_limit(text) for text in args.rate_limit),
+                              max_concurrency=max(HTTP_POOL_SIZE, args.geocode_concurrency + args.weather_concurrency))
+    except ValueError as e:
+        print(f"[ERROR] | Invalid --rate-limit: {e}")
+        return 1
+    if args.daily_aggregates:
+        configure_daily_aggregates(args.daily_aggregates)
+    if args.profile or args.profile_metrics:
+        enable_profiling(keep_events=bool(args.profile_metrics))
+    if args.archive or args.archive_file:
+        enable_forecast_archive(args.archive_file)
+    if args.city_index:
+        city_index.reset(args.city_index)
+    if args.build_city_index:
+        try:
+            count = build_city_index(args.build_city_index, args.city_index, args.admin1_codes, args.index_alternate_names)
+        except OSError as e:
+            print(f"[ERROR] | Could not build the city index: {e}")
+            return 1
+        print(f"City index with {count} cities written to '{city_index._get_path()}'.")
+        return 0
+    api_key = load_config()
+    if args.serve:
+        if not api_key and not city_index.available():
+            print("[WARNING] | OPENWEATHERMAP_API_KEY not set and no offline city index; the service will only answer lat/lon queries.")
+        serve(args.host, args.port, api_key, args.sections, args.access_log, args.models)
+        return 0
+    if args.history or args.observed is not None:
+        return _run_archive_query(args, api_key)
+    if not api_key and (args.prewarm or not city_index.available()):
+        print("[ERROR] | OPENWEATHERMAP_API_KEY not found in environment variables. Please set it in .env file"
+              + ("." if args.prewarm else " or build the offline city index with --build-city-index."))
+        return 1
+
+    if args.watch:
+        if args.models and len(args.models) > 1:
+            print("[ERROR] | --watch follows a single model; pass one model with --models.")
+            return 1
+        return _run_watch(args, api_key)
+
+    if args.prewarm:
+        try:
+            city_list = _open_city_list(args.prewarm)
+        except OSError as e:
+            print(f"[ERROR] | Could not read city list '{args.prewarm}': {e}")
+            return 1
+        with city_list as city_lines:
+            warmed, failed = prewarm_geocode_cache(city_lines, api_key)
+        print(f"Geocoding cache pre-warmed with {warmed} new cities ({len(failed)} failed).")
+        for city_name in failed:
+            print(f"  [FAILED] | {city_name}")
+    elif args.batch:
+        if args.geocode_concurrency < 1 or args.weather_concurrency < 1:
+            print("[ERROR] | Concurrency limits must be at least 1.")
+            return 1
+        try:
+            city_list = _open_city_list(args.batch)
+        except OSError as e:
+            print(f"[ERROR] | Could not read city list '{args.batch}': {e}")
+            return 1
+        with city_list as city_lines, _report_output(args.output_format) as out:
+            succeeded, failed = run_batch(city_lines, api_key, args.geocode_concurrency,
+                                          args.weather_concurrency, use_cache=not args.no_cache, sections=args.sections,
+                                          renderer=get_renderer(args.output_format, args.sections, args.models), out=out,
+                                          models=args.models)
+            _print_diagnostics(args)
+        return 1 if failed and not succeeded else 0
+    else:
+        city_input = (args.city or input("Enter city name: ")).strip()
+        if not city_input:
+            print("[ERROR] | City name cannot be empty.")
+            return 1
+        with _report_output(args.output_format) as out:
+            reported = report_city(city_input, api_key, use_cache=not args.no_cache, sections=args.sections,
+                                   renderer=get_renderer(args.output_format, args.sections, args.models), out=out, models=args.models)
+            _print_diagnostics(args)
+        return 0 if reported else 1
+
+    _print_diagnostics(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
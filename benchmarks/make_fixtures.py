@@ -0,0 +1,221 @@
+"""
+Builds the offline fixtures used by run_benchmarks.py and stub_server.py.
+
+By default the responses are synthesized in the exact shape Open-Meteo and the
+OpenWeatherMap geocoder return, with the variables WeatherReporter requests.
+Pass --record to capture live responses instead (needs network access and
+OPENWEATHERMAP_API_KEY for the geocoding fixture).
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import WeatherReporter as wr
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FORECAST_DAYS = (1, 16)
+MULTI_LOCATION_COUNT = 20
+START_DATE = datetime(2025, 6, 1)
+
+CITIES = (
+    ("Berlin", "DE", None, 52.5170, 13.3889, 7200, "Europe/Berlin"),
+    ("Paris", "FR", "Ile-de-France", 48.8589, 2.3200, 7200, "Europe/Paris"),
+    ("London", "GB", "England", 51.5073, -0.1277, 3600, "Europe/London"),
+    ("Madrid", "ES", "Community of Madrid", 40.4167, -3.7036, 7200, "Europe/Madrid"),
+    ("Rome", "IT", "Lazio", 41.8933, 12.4829, 7200, "Europe/Rome"),
+    ("Vienna", "AT", None, 48.2084, 16.3725, 7200, "Europe/Vienna"),
+    ("Warsaw", "PL", "Masovian Voivodeship", 52.2319, 21.0067, 7200, "Europe/Warsaw"),
+    ("Prague", "CZ", "Prague", 50.0875, 14.4213, 7200, "Europe/Prague"),
+    ("Amsterdam", "NL", "North Holland", 52.3728, 4.8936, 7200, "Europe/Amsterdam"),
+    ("Stockholm", "SE", None, 59.3251, 18.0711, 7200, "Europe/Stockholm"),
+    ("Oslo", "NO", None, 59.9133, 10.7389, 7200, "Europe/Oslo"),
+    ("Helsinki", "FI", "Uusimaa", 60.1674, 24.9426, 10800, "Europe/Helsinki"),
+    ("Lisbon", "PT", None, 38.7078, -9.1366, 3600, "Europe/Lisbon"),
+    ("Athens", "GR", "Attica", 37.9756, 23.7348, 10800, "Europe/Athens"),
+    ("Dublin", "IE", None, 53.3498, -6.2603, 3600, "Europe/Dublin"),
+    ("Budapest", "HU", None, 47.4980, 19.0399, 7200, "Europe/Budapest"),
+    ("Zagreb", "HR", "City of Zagreb", 45.8131, 15.9771, 7200, "Europe/Zagreb"),
+    ("Copenhagen", "DK", "Capital Region of Denmark", 55.6867, 12.5701, 7200, "Europe/Copenhagen"),
+    ("Brussels", "BE", "Brussels-Capital", 50.8467, 4.3525, 7200, "Europe/Brussels"),
+    ("Bucharest", "RO", None, 44.4361, 26.1027, 10800, "Europe/Bucharest"),
+)
+
+INTEGER_FIELDS = {"weather_code", "relative_humidity_2m", "cloud_cover", "is_day", "precipitation_probability",
+                  "precipitation_probability_max", "wind_direction_10m", "wind_direction_10m_dominant"}
+UNITS = {
+    "time": "iso8601", "interval": "seconds", "weather_code": "wmo code", "is_day": "",
+    "temperature_2m": "°C", "temperature_2m_max": "°C", "temperature_2m_min": "°C", "dew_point_2m": "°C",
+    "dew_point_2m_mean": "°C", "wet_bulb_temperature_2m": "°C", "relative_humidity_2m": "%", "cloud_cover": "%",
+    "precipitation_probability": "%", "precipitation_probability_max": "%", "precipitation": "mm", "rain": "mm",
+    "showers": "mm", "snowfall": "cm", "precipitation_sum": "mm", "rain_sum": "mm", "showers_sum": "mm",
+    "snowfall_sum": "cm", "precipitation_hours": "h", "snow_depth": "m", "evapotranspiration": "mm",
+    "visibility": "m", "visibility_mean": "m", "wind_speed_10m": "km/h", "wind_speed_10m_max": "km/h",
+    "wind_gusts_10m": "km/h", "wind_gusts_10m_max": "km/h", "wind_direction_10m": "°",
+    "wind_direction_10m_dominant": "°", "pressure_msl": "hPa", "surface_pressure": "hPa", "uv_index": "",
+    "uv_index_max": "", "freezing_level_height": "m", "sunrise": "iso8601", "sunset": "iso8601",
+    "daylight_duration": "s", "sunshine_duration": "s",
+}
+WEATHER_CODES = (0, 0, 1, 1, 2, 2, 3, 3, 45, 51, 61, 63, 80, 95)
+
+
+def _hourly_value(rng, field, hour_of_day, base_temp):
+    diurnal = math.sin((hour_of_day - 9) / 24 * 2 * math.pi)
+    rain = max(0.0, rng.gauss(-0.6, 0.8))
+    values = {
+        "temperature_2m": base_temp + 6 * diurnal + rng.gauss(0, 0.7),
+        "dew_point_2m": base_temp - 6 + rng.gauss(0, 1.0),
+        "wet_bulb_temperature_2m": base_temp - 2 + 3 * diurnal + rng.gauss(0, 0.5),
+        "relative_humidity_2m": min(100, max(20, int(70 - 20 * diurnal + rng.gauss(0, 5)))),
+        "precipitation_probability": min(100, max(0, int(rng.gauss(20, 20)))),
+        "precipitation": rain, "rain": rain * 0.8, "showers": rain * 0.2, "snowfall": 0.0, "snow_depth": 0.0,
+        "cloud_cover": min(100, max(0, int(rng.gauss(50, 30)))),
+        "visibility": max(200.0, rng.gauss(30000, 12000)),
+        "evapotranspiration": max(0.0, 0.2 * diurnal + rng.gauss(0, 0.03)),
+        "weather_code": rng.choice(WEATHER_CODES),
+        "pressure_msl": rng.gauss(1015, 6), "surface_pressure": rng.gauss(1005, 6),
+        "wind_speed_10m": max(0.0, rng.gauss(12, 5)), "wind_gusts_10m": max(0.0, rng.gauss(25, 8)),
+        "wind_direction_10m": rng.randrange(360),
+        "uv_index": max(0.0, 7 * diurnal), "freezing_level_height": rng.gauss(3200, 300),
+        "is_day": 1 if 6 <= hour_of_day < 21 else 0,
+    }
+    return values[field]
+
+
+def _round(field, value):
+    if field in INTEGER_FIELDS:
+        return int(value)
+    return round(value, 2 if field in ("evapotranspiration", "snow_depth") else 1)
+
+
+def synthesize_forecast(city, days, seed):
+    name, _country, _state, lat, lon, utc_offset, tz_name = city
+    rng = random.Random(seed)
+    base_temp = rng.uniform(10, 24)
+    hourly_times = [START_DATE + timedelta(hours=h) for h in range(24 * days)]
+    hourly = {"time": [t.strftime("%Y-%m-%dT%H:%M") for t in hourly_times]}
+    for field in wr.HOURLY_SECTION_FIELDS:
+        hourly[field] = [_round(field, _hourly_value(rng, field, t.hour, base_temp)) for t in hourly_times]
+
+    daily_dates = [START_DATE + timedelta(days=d) for d in range(days)]
+    daily = {"time": [d.strftime("%Y-%m-%d") for d in daily_dates]}
+    for field in wr.DAILY_SECTION_FIELDS:
+        column = []
+        for d in range(days):
+            hours = slice(24 * d, 24 * (d + 1))
+            if field == "sunrise":
+                value = daily_dates[d].strftime("%Y-%m-%dT04:5") + str(rng.randrange(10))
+            elif field == "sunset":
+                value = daily_dates[d].strftime("%Y-%m-%dT21:2") + str(rng.randrange(10))
+            elif field == "daylight_duration":
+                value = round(rng.uniform(55000, 60000), 2)
+            elif field == "sunshine_duration":
+                value = round(rng.uniform(10000, 50000), 2)
+            elif field == "temperature_2m_max":
+                value = max(hourly["temperature_2m"][hours])
+            elif field == "temperature_2m_min":
+                value = min(hourly["temperature_2m"][hours])
+            elif field in ("precipitation_sum", "rain_sum", "showers_sum", "snowfall_sum"):
+                value = round(sum(hourly[field.replace("_sum", "")][hours]), 1)
+            elif field == "precipitation_hours":
+                value = float(sum(1 for p in hourly["precipitation"][hours] if p > 0))
+            elif field == "precipitation_probability_max":
+                value = max(hourly["precipitation_probability"][hours])
+            elif field == "weather_code":
+                value = max(hourly["weather_code"][hours])
+            elif field == "uv_index_max":
+                value = max(hourly["uv_index"][hours])
+            elif field == "wind_speed_10m_max":
+                value = max(hourly["wind_speed_10m"][hours])
+            elif field == "wind_gusts_10m_max":
+                value = max(hourly["wind_gusts_10m"][hours])
+            elif field == "wind_direction_10m_dominant":
+                value = rng.randrange(360)
+            elif field == "dew_point_2m_mean":
+                value = round(sum(hourly["dew_point_2m"][hours]) / 24, 1)
+            elif field == "visibility_mean":
+                value = round(sum(hourly["visibility"][hours]) / 24, 1)
+            else:
+                value = None
+            column.append(value)
+        daily[field] = column
+
+    current_index = 14
+    current = {"time": START_DATE.strftime("%Y-%m-%dT14:15"), "interval": 900}
+    for field in wr.CURRENT_SECTION_FIELDS:
+        current[field] = hourly[field][current_index] if field in hourly else _round(field, _hourly_value(rng, field, 14, base_temp))
+
+    return {
+        "latitude": round(lat, 3), "longitude": round(lon, 3), "generationtime_ms": round(rng.uniform(0.2, 2.0), 3),
+        "utc_offset_seconds": utc_offset, "timezone": tz_name, "timezone_abbreviation": f"GMT+{utc_offset // 3600}",
+        "elevation": round(rng.uniform(0, 300), 1),
+        "current_units": {field: UNITS.get(field, "") for field in current}, "current": current,
+        "hourly_units": {field: UNITS.get(field, "") for field in hourly}, "hourly": hourly,
+        "daily_units": {field: UNITS.get(field, "") for field in daily}, "daily": daily,
+    }
+
+
+def synthesize_geocoding(city):
+    name, country, state, lat, lon, _utc_offset, _tz_name = city
+    entry = {"name": name, "local_names": {"en": name}, "lat": lat, "lon": lon, "country": country}
+    if state:
+        entry["state"] = state
+    return [entry]
+
+
+def record_forecast(cities, days):
+    params = wr.build_weather_params(",".join(str(c[3]) for c in cities), ",".join(str(c[4]) for c in cities))
+    params["forecast_days"] = days
+    response = wr.http_get(wr.FORECAST_STAGE, wr.WEATHER_API_URL_BASE, params)
+    response.raise_for_status()
+    data = response.json()
+    return data if isinstance(data, list) else [data]
+
+
+def record_geocoding(city, api_key):
+    params = {"q": city[0], "limit": 1, "appid": api_key}
+    response = wr.http_get(wr.GEOCODING_STAGE, wr.GEOCODING_API_URL, params)
+    response.raise_for_status()
+    return response.json()
+
+
+def write_fixture(name, document):
+    path = os.path.join(FIXTURES_DIR, name)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False, separators=(",", ":"))
+    print(f"Wrote {path} ({os.path.getsize(path)} bytes compressed)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build benchmark fixtures (synthetic by default).")
+    parser.add_argument("--record", action="store_true", help="Record live API responses instead of synthesizing them")
+    args = parser.parse_args(argv)
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    cities = CITIES[:MULTI_LOCATION_COUNT]
+    for days in FORECAST_DAYS:
+        if args.record:
+            forecasts = record_forecast(cities, days)
+        else:
+            forecasts = [synthesize_forecast(city, days, seed=i * 100 + days) for i, city in enumerate(cities)]
+        write_fixture(f"forecast_{days}d.json.gz", forecasts)
+
+    if args.record:
+        api_key = wr.load_config()
+        if not api_key:
+            print("[ERROR] | OPENWEATHERMAP_API_KEY is needed to record geocoding responses.")
+            return 1
+        geocoding = {city[0]: record_geocoding(city, api_key) for city in cities}
+    else:
+        geocoding = {city[0]: synthesize_geocoding(city) for city in cities}
+    write_fixture("geocoding.json.gz", geocoding)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
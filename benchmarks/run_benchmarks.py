@@ -0,0 +1,240 @@
+"""
+Offline benchmarks for WeatherReporter.
+
+Every upstream call goes to the local stub in stub_server.py, so runs are
+repeatable and need no API key or network. Each stage is measured separately
+(geocoding, forecast fetch, JSON decode, Forecast parsing, rendering), plus an
+end-to-end batch run, for 1 and 16 forecast days and for one and many
+locations. Results are written to benchmarks/results/ so runs can be compared:
+
+    python benchmarks/run_benchmarks.py --latency-ms 50
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<earlier run>.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARKS_DIR)
+os.environ.setdefault("WEATHER_REPORTER_CACHE_DIR", tempfile.mkdtemp(prefix="weather_reporter_bench_"))
+
+import WeatherReporter as wr
+from stub_server import FORECAST_PATH, FORECAST_SECTIONS, GEOCODING_PATH, load_fixture, select_forecast_fields, start_stub_server
+
+BENCH_API_KEY = "benchmark"
+IMPORT_TIME_BUDGET_MS = 20.0
+# Imported only once the network or .env is actually needed; seeing them after a bare import is a regression
+LAZY_MODULES = ("requests", "urllib3", "dotenv", "http.server", "concurrent.futures")
+IMPORT_PROBE = (
+    "import sys, time, json\n"
+    "started = time.perf_counter()\n"
+    "import WeatherReporter\n"
+    "elapsed = (time.perf_counter() - started) * 1000\n"
+    "print(json.dumps({'ms': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))\n"
+) % (LAZY_MODULES,)
+
+
+def measure(fn, min_repeats, min_seconds, items=1):
+    """ Runs fn until both limits are reached; returns latency stats in ms and throughput in items/s """
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < min_repeats or time.perf_counter() - started < min_seconds:
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    timings.sort()
+    return {
+        "repeats": len(timings),
+        "mean_ms": statistics.fmean(timings) * 1000,
+        "median_ms": timings[len(timings) // 2] * 1000,
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+        "min_ms": timings[0] * 1000,
+        "items_per_s": items / statistics.fmean(timings) if timings else 0.0,
+    }
+
+
+def measure_peak_memory(fn):
+    """ Peak memory in KiB allocated by Python while fn runs once """
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def measure_import(repeats):
+    """ Times a bare 'import WeatherReporter' in fresh interpreters, after one run to write the bytecode cache """
+    env = {key: value for key, value in os.environ.items() if key != "PYTHONDONTWRITEBYTECODE"}
+    timings, loaded = [], set()
+    for _ in range(repeats + 1):
+        completed = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=REPO_DIR, env=env,
+                                   capture_output=True, text=True, check=True)
+        probe = json.loads(completed.stdout)
+        timings.append(probe["ms"])
+        loaded.update(probe["loaded"])
+    timings = sorted(timings[1:])
+    return {
+        "repeats": len(timings),
+        "mean_ms": statistics.fmean(timings),
+        "median_ms": timings[len(timings) // 2],
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "min_ms": timings[0],
+        "items_per_s": 1000 / statistics.fmean(timings),
+        "budget_ms": IMPORT_TIME_BUDGET_MS,
+        "eagerly_loaded": sorted(loaded),
+    }
+
+
+def _point_at_stub(base_url):
+    wr.WEATHER_API_URL_BASE = base_url + FORECAST_PATH
+    wr.GEOCODING_API_URL = base_url + GEOCODING_PATH
+
+
+def _end_to_end(city_names, sections):
+    out = io.StringIO()
+    renderer = wr.TextRenderer(sections)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _, resolved_name, weather_data, error in wr.iter_batch_reports(city_names, BENCH_API_KEY, use_cache=False, sections=sections):
+            if not error:
+                out.write(renderer.render(weather_data, resolved_name))
+    return out
+
+
+def build_benchmarks(stubs, geocoding, days_options, location_count):
+    """ Yields (name, fn, items) """
+    city_names = list(geocoding)[:location_count]
+    # The payloads as the API returns them for a full report, so parsing includes the local daily aggregates
+    params = wr.build_weather_params(0, 0)
+    requested = {section: params[section] for section in FORECAST_SECTIONS if section in params}
+    for days in days_options:
+        forecasts = [select_forecast_fields(forecast, requested)
+                     for forecast in load_fixture(f"forecast_{days}d.json.gz")[:location_count]]
+        single, many = forecasts[0], forecasts
+        single_bytes = json.dumps(single, separators=(",", ":")).encode("utf-8")
+        many_bytes = json.dumps(many, separators=(",", ":")).encode("utf-8")
+        coords = [(f["latitude"], f["longitude"]) for f in many]
+        base_url = stubs[days]
+        n = len(many)
+
+        yield f"decode/{days}d/1loc", lambda b=single_bytes: json.loads(b), 1
+        yield f"decode/{days}d/{n}loc", lambda b=many_bytes: json.loads(b), n
+        yield f"decode_backend/{days}d/{n}loc", lambda b=many_bytes: wr.decode_json(wr.FORECAST_STAGE, b), n
+        many_chunks = [many_bytes[i:i + wr.STREAM_CHUNK_BYTES] for i in range(0, len(many_bytes), wr.STREAM_CHUNK_BYTES)]
+        yield f"decode_stream/{days}d/{n}loc", lambda c=many_chunks: sum(1 for _ in wr.iter_json_values(c)), n
+        yield f"parse/{days}d/1loc", lambda p=single: wr.parse_forecast(p), 1
+        yield f"render_text/{days}d/1loc", lambda p=single: wr.render_text_report(p, "Bench City"), 1
+        yield f"render_json/{days}d/1loc", lambda p=single: wr.NdjsonRenderer().render(p, "Bench City"), 1
+        yield f"render_csv/{days}d/1loc", lambda p=single: wr.CsvRenderer().render(p, "Bench City"), 1
+        yield f"fetch/{days}d/1loc", lambda u=base_url, c=coords[0]: (_point_at_stub(u), wr.get_weather_data(*c, use_cache=False)), 1
+        yield f"fetch_many/{days}d/{n}loc", lambda u=base_url, c=coords: (_point_at_stub(u), wr.get_weather_data_many(c, use_cache=False)), n
+        yield (f"end_to_end/{days}d/{len(city_names)}cities",
+               lambda u=base_url: (_point_at_stub(u), _end_to_end(city_names, wr.DISPLAY_SECTIONS)), len(city_names))
+
+    base_url = stubs[days_options[0]]
+    yield "geocode/1city", lambda u=base_url, c=city_names[0]: (_point_at_stub(u), wr.get_coordinates(c, BENCH_API_KEY, use_cache=False)), 1
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(previous, current):
+    print(f"\nCompared with {previous['meta']['timestamp']} ({previous['meta'].get('git_revision') or 'unknown revision'}):")
+    for name, stats in current["results"].items():
+        before = previous["results"].get(name)
+        if not before:
+            print(f"  {name:<32} new")
+            continue
+        change = (stats["median_ms"] - before["median_ms"]) / before["median_ms"] * 100 if before["median_ms"] else 0.0
+        print(f"  {name:<32} {before['median_ms']:>10.3f} ms -> {stats['median_ms']:>10.3f} ms  ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline WeatherReporter benchmarks.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated upstream latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random +/- variation of the latency")
+    parser.add_argument("--days", type=int, nargs="+", choices=(1, 16), default=[1, 16], help="Forecast fixtures to use")
+    parser.add_argument("--locations", type=int, default=20, help="Locations in the multi-location benchmarks (max 20)")
+    parser.add_argument("--repeats", type=int, default=10, help="Minimum repetitions per benchmark")
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="Minimum time spent per benchmark")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/bench-<timestamp>.json)")
+    parser.add_argument("--compare", metavar="FILE", help="Earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    stubs, servers = {}, []
+    for days in args.days:
+        server, base_url = start_stub_server(days=days, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+        servers.append(server)
+        stubs[days] = base_url
+    geocoding = load_fixture("geocoding.json.gz")
+    # The stub has no quota: measure the client, not the upstream rate limits
+    wr.configure_rate_limits({stage: None for stage in wr.UPSTREAM_RATE_LIMITS})
+
+    results = {}
+    print(f"{'benchmark':<32} {'median':>12} {'p95':>12} {'items/s':>12}")
+    if args.filter in "import/module":
+        stats = results["import/module"] = measure_import(args.repeats)
+        print(f"{'import/module':<32} {stats['median_ms']:>9.3f} ms {stats['p95_ms']:>9.3f} ms {stats['items_per_s']:>12.1f}")
+        if stats["median_ms"] > IMPORT_TIME_BUDGET_MS:
+            print(f"[WARNING] | Importing WeatherReporter took {stats['median_ms']:.1f} ms, over the {IMPORT_TIME_BUDGET_MS:.0f} ms budget")
+        if stats["eagerly_loaded"]:
+            print(f"[WARNING] | Importing WeatherReporter loaded {', '.join(stats['eagerly_loaded'])}, which should load lazily")
+    for name, fn, items in build_benchmarks(stubs, geocoding, args.days, min(args.locations, 20)):
+        if args.filter not in name:
+            continue
+        fn()
+        stats = measure(fn, args.repeats, args.min_seconds, items)
+        if name.startswith("decode"):
+            stats["peak_kib"] = measure_peak_memory(fn)
+        results[name] = stats
+        peak = f" {stats['peak_kib']:>9} KiB peak" if "peak_kib" in stats else ""
+        print(f"{name:<32} {stats['median_ms']:>9.3f} ms {stats['p95_ms']:>9.3f} ms {stats['items_per_s']:>12.1f}{peak}")
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+    document = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "json_backend": wr.json_backend(),
+            "options": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), document)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Local stand-in for the Open-Meteo forecast and OpenWeatherMap geocoding APIs.
+
+Replays the fixtures in benchmarks/fixtures with a configurable delay so
+benchmarks never touch the real services. A forecast request for N
+comma-separated locations gets N entries back, cycling through the fixture,
+each holding only the variables the request asked for.
+
+    python benchmarks/stub_server.py --port 8765 --days 16 --latency-ms 80
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FORECAST_PATH = "/v1/forecast"
+GEOCODING_PATH = "/geo/1.0/direct"
+FORECAST_SECTIONS = ("current", "daily", "hourly")
+
+
+def load_fixture(name):
+    with gzip.open(os.path.join(FIXTURES_DIR, name), "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def select_forecast_fields(forecast, requested):
+    """ A copy of a fixture forecast holding only the requested variables of each section named in requested
+    (section -> comma-separated variables), like the real API; other sections are left as they are """
+    selected = dict(forecast)
+    for section, fields in requested.items():
+        if section not in forecast:
+            continue
+        keep = {"time", "interval"}.union(fields.split(","))
+        selected[section] = {key: value for key, value in forecast[section].items() if key in keep}
+        units = forecast.get(f"{section}_units")
+        if units is not None:
+            selected[f"{section}_units"] = {key: value for key, value in units.items() if key in keep}
+    return selected
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this, Nagle plus delayed ACKs add ~40 ms per request
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, document):
+        body = json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            body = gzip.compress(body, compresslevel=5)
+            encoding = "gzip"
+        else:
+            encoding = None
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        if server.latency_s or server.jitter_s:
+            time.sleep(max(0.0, server.latency_s + random.uniform(-server.jitter_s, server.jitter_s)))
+        with server.counter_lock:
+            server.request_count += 1
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == FORECAST_PATH:
+            location_count = len(query.get("latitude", [""])[0].split(","))
+            forecasts = server.forecasts_for(query)
+            payload = [forecasts[i % len(forecasts)] for i in range(location_count)]
+            self._reply(200, payload[0] if location_count == 1 else payload)
+        elif url.path == GEOCODING_PATH:
+            city = query.get("q", [""])[0]
+            self._reply(200, server.geocoding.get(city, []))
+        else:
+            self._reply(404, {"error": True, "reason": f"unknown path {url.path}"})
+
+
+def create_stub_server(host="127.0.0.1", port=0, days=1, latency_ms=0.0, jitter_ms=0.0):
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.forecasts = load_fixture(f"forecast_{days}d.json.gz")
+    selections = {}
+
+    def forecasts_for(query):
+        # Variables the request leaves out (e.g. daily aggregates it computes locally) are not sent back
+        requested = {section: query[section][0] for section in FORECAST_SECTIONS if section in query}
+        key = tuple(sorted(requested.items()))
+        if key not in selections:
+            selections[key] = [select_forecast_fields(forecast, requested) for forecast in server.forecasts]
+        return selections[key]
+
+    server.forecasts_for = forecasts_for
+    server.geocoding = load_fixture("geocoding.json.gz")
+    server.latency_s = latency_ms / 1000.0
+    server.jitter_s = jitter_ms / 1000.0
+    server.request_count = 0
+    server.counter_lock = threading.Lock()
+    return server
+
+
+def start_stub_server(**kwargs):
+    """ Starts the stub on a background thread and returns (server, base_url) """
+    server = create_stub_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve synthesized weather API responses locally.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--days", type=int, choices=(1, 16), default=1, help="Which forecast fixture to serve")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random +/- variation of the delay")
+    args = parser.parse_args(argv)
+
+    server = create_stub_server(args.host, args.port, args.days, args.latency_ms, args.jitter_ms)
+    base_url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    print(f"Stub APIs on {base_url}{FORECAST_PATH} and {base_url}{GEOCODING_PATH} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+import WeatherReporter
+from stub_server import FORECAST_SECTIONS, load_fixture, select_forecast_fields
+
+
+class LocalDailyAggregatesTest(unittest.TestCase):
+
+    def test_match_server_side_daily_values(self):
+        params = WeatherReporter.build_weather_params(0, 0)
+        requested = {section: params[section] for section in FORECAST_SECTIONS if section in params}
+        for days in (1, 16):
+            for payload in load_fixture(f"forecast_{days}d.json.gz")[:3]:
+                trimmed = select_forecast_fields(payload, requested)
+                computed = [field for field in WeatherReporter.LOCAL_DAILY_FIELDS if field in payload["daily"]]
+                self.assertTrue(computed)
+                self.assertFalse(set(computed) & set(trimmed["daily"]))
+
+                daily = WeatherReporter.parse_forecast(trimmed).daily
+                for field in computed:
+                    with self.subTest(days=days, field=field):
+                        self.assertEqual(len(daily.values(field)), len(payload["daily"][field]))
+                        for local, server in zip(daily.values(field), payload["daily"][field]):
+                            self.assertAlmostEqual(local, server, places=6)
+
+
+if __name__ == "__main__":
+    unittest.main()
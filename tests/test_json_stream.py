@@ -0,0 +1,74 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import WeatherReporter
+from WeatherReporter import iter_json_values
+
+
+def split_every(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class IterJsonValuesTest(unittest.TestCase):
+
+    def test_values_split_across_chunk_boundaries(self):
+        data = b'[{"latitude": 52.5, "name": "Berlin"}, {"latitude": 48.85, "name": "Paris"}]'
+        for size in (1, 2, 3, 7, len(data)):
+            with self.subTest(size=size):
+                values = list(iter_json_values(split_every(data, size)))
+                self.assertEqual(values, [{"latitude": 52.5, "name": "Berlin"}, {"latitude": 48.85, "name": "Paris"}])
+
+    def test_nested_arrays(self):
+        data = b'[[1, [2, 3]], {"hourly": {"time": ["a", "b"], "t": [[1], []]}}, []]'
+        values = list(iter_json_values(split_every(data, 4)))
+        self.assertEqual(values, [[1, [2, 3]], {"hourly": {"time": ["a", "b"], "t": [[1], []]}}, []])
+
+    def test_brackets_and_escapes_inside_strings(self):
+        data = b'[{"s": "]}[{,\\"\\\\"}, {"s": "\\u00e9"}]'
+        values = list(iter_json_values(split_every(data, 1)))
+        self.assertEqual(values, [{"s": ']}[{,"\\'}, {"s": "é"}])
+
+    def test_empty_array(self):
+        self.assertEqual(list(iter_json_values([b"[", b" ", b"]"])), [])
+
+    def test_single_object_document(self):
+        self.assertEqual(list(iter_json_values([b'{"latitude":', b' 1.0}'])), [{"latitude": 1.0}])
+
+    def test_truncated_input(self):
+        for data in (b'[{"latitude": 1.0}, {"latitude"', b'[{"latitude": 1.0}', b"["):
+            with self.subTest(data=data):
+                with self.assertRaises(ValueError):
+                    list(iter_json_values(split_every(data, 5)))
+
+    def test_empty_document(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_values([b"", b"  "]))
+
+
+class MismatchedBatchResponseTest(unittest.TestCase):
+
+    COORDS = [(52.5, 13.4), (48.9, 2.4), (40.4, -3.7)]
+
+    def fetch_many(self, streamed):
+        with mock.patch.object(WeatherReporter, "_stream_weather_data", lambda params: iter(streamed)), \
+                mock.patch("builtins.print"):
+            return WeatherReporter.get_weather_data_many(self.COORDS, use_cache=False)
+
+    def test_extra_value(self):
+        streamed = [{"latitude": lat} for lat, _ in self.COORDS] + [{"latitude": 0.0}]
+        self.assertEqual(self.fetch_many(streamed), [{"latitude": 52.5}, {"latitude": 48.9}, {"latitude": 40.4}])
+
+    def test_non_object_value(self):
+        streamed = [{"latitude": 52.5}, [1, 2], {"latitude": 40.4}]
+        self.assertEqual(self.fetch_many(streamed), [{"latitude": 52.5}, None, None])
+
+    def test_short_response(self):
+        self.assertEqual(self.fetch_many([{"latitude": 52.5}]), [{"latitude": 52.5}, None, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import WeatherReporter
+
+
+def model_payload(precipitation_probability, cloud_cover):
+    hours = [f"2026-10-17T{hour:02d}:00" for hour in range(24)]
+    return {
+        "latitude": 52.5, "longitude": 13.4, "timezone": "GMT", "utc_offset_seconds": 0,
+        "current": {"time": "2026-10-17T20:00", "temperature_2m": 10.0},
+        "daily": {"time": ["2026-10-17"], "precipitation_probability_max": [precipitation_probability]},
+        "daily_units": {"precipitation_probability_max": "%"},
+        "hourly": {
+            "time": hours,
+            "precipitation_probability": [precipitation_probability] * 24,
+            "cloud_cover": [cloud_cover] * 24,
+            "relative_humidity_2m": [cloud_cover] * 24,
+        },
+        "hourly_units": {"precipitation_probability": "%", "cloud_cover": "%", "relative_humidity_2m": "%"},
+    }
+
+
+class EnsembleTextReportTest(unittest.TestCase):
+
+    MODELS = ("icon_seamless", "gfs_seamless", "ecmwf_ifs025")
+
+    def render(self, sections):
+        payloads = dict(zip(self.MODELS, (model_payload(50, 20), model_payload(55, 25), model_payload(58, 31))))
+        with mock.patch.object(WeatherReporter, "get_weather_data",
+                               lambda latitude, longitude, use_cache, sections, model: payloads[model]):
+            forecast = WeatherReporter.get_ensemble_data(52.5, 13.4, self.MODELS, use_cache=False, sections=sections)
+        return WeatherReporter.render_text_report(forecast, "Berlin", sections)
+
+    def test_daily_percent_means_are_rounded(self):
+        report = self.render(("daily",))
+        self.assertIn("54%", report)
+        self.assertNotIn("54.3", report)
+
+    def test_hourly_percent_means_and_bands_are_rounded(self):
+        report = self.render(("current", "hourly"))
+        self.assertIn("54% [50 – 58%", report)
+        self.assertIn("25% [20 – 31%", report)
+        self.assertNotIn("54.3", report)
+        self.assertNotIn("25.3", report)
+
+    def test_single_model_percentages_are_unchanged(self):
+        report = WeatherReporter.render_text_report(model_payload(55, 25), "Berlin", ("daily",))
+        self.assertIn("55%", report)
+
+
+if __name__ == "__main__":
+    unittest.main()